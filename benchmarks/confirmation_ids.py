@@ -0,0 +1,153 @@
+"""
+Confirmation number uniqueness stress test.
+
+Starts worker processes (forked, as gunicorn does, and optionally spawned
+as after a restart) that each hammer generate_confirmation_number from
+several threads, all sharing one lease file in a temporary directory.
+Checks that every number is unique across all workers and carries a
+valid check character, and reports the generation rate. For comparison,
+the old timestamp-plus-random scheme is run through the same burst and
+its duplicates counted. --block shrinks the lease blocks so that workers
+go through many leases during the run.
+
+Then --restarts containers are started one after another, each with an
+empty lease file of its own as a redeployed container has, and the
+numbers of all of them are checked for repeats. Each waits until the
+clock has passed the previous container's last lease, which a real
+redeploy takes far longer than.
+
+Run from the repository root:
+
+    python -m benchmarks.confirmation_ids --processes 4 --threads 8 --count 50000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import main
+
+
+def legacy_confirmation_number() -> str:
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return f"SBH{timestamp[-6:]}{random.randint(100, 999)}"
+
+
+def burst(generate, thread_count: int, count: int):
+    numbers = []
+    lock = threading.Lock()
+    start = threading.Barrier(thread_count)
+
+    def worker():
+        start.wait()
+        local = [generate() for _ in range(count)]
+        with lock:
+            numbers.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return numbers
+
+
+def worker_process(lease_path, block, thread_count, count, results):
+    main.CONFIRMATION_NUMBERS.lease_path = lease_path
+    main.ConfirmationNumbers.BLOCK = block
+    started = time.perf_counter()
+    numbers = burst(main.generate_confirmation_number, thread_count, count)
+    results.put((os.getpid(), time.perf_counter() - started, numbers))
+
+
+def run_workers(method: str, lease_path: str, args):
+    context = multiprocessing.get_context(method)
+    results = context.Queue()
+    processes = [context.Process(target=worker_process,
+                                 args=(lease_path, args.block, args.threads, args.count, results))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return collected
+
+
+def restarts(args):
+    numbers = []
+    last_lease = 0
+    for _ in range(args.restarts):
+        with tempfile.TemporaryDirectory() as directory:
+            lease_path = os.path.join(directory, "confirmation.lease")
+            wait = last_lease + 1 - (time.time() - main.ConfirmationNumbers.EPOCH)
+            if wait > 0:
+                time.sleep(wait)
+            for _, _, worker_numbers in run_workers("spawn", lease_path, args):
+                numbers.extend(worker_numbers)
+            with open(lease_path) as f:
+                last_lease = int(f.read())
+    return numbers
+
+
+def report(label: str, numbers, seconds: float = None):
+    duplicates = len(numbers) - len(set(numbers))
+    invalid = sum(not main.ConfirmationNumbers.is_valid(number) for number in numbers)
+    rate = f"{len(numbers) / seconds:>12,.0f}/s" if seconds else ""
+    print(f"{label:<26} {len(numbers):>9,} numbers {duplicates:>8,} duplicates "
+          f"{invalid:>6,} invalid {rate}")
+    return duplicates + invalid
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--count", type=int, default=50000,
+                        help="numbers per thread")
+    parser.add_argument("--block", type=int, default=main.ConfirmationNumbers.BLOCK,
+                        help="numbers per leased prefix")
+    parser.add_argument("--methods", nargs="+", default=["fork", "spawn"],
+                        choices=multiprocessing.get_all_start_methods())
+    parser.add_argument("--restarts", type=int, default=3,
+                        help="containers started in turn with fresh lease files")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        lease_path = os.path.join(directory, "confirmation.lease")
+        # Lease a block in the parent first, so forked children inherit
+        # a used counter and have to start over
+        main.CONFIRMATION_NUMBERS.lease_path = lease_path
+        everything = [main.generate_confirmation_number()]
+        for method in args.methods:
+            started = time.perf_counter()
+            collected = run_workers(method, lease_path, args)
+            numbers = [number for _, _, worker_numbers in collected
+                       for number in worker_numbers]
+            failures += report(f"{method} x{args.processes} x{args.threads} threads",
+                               numbers, time.perf_counter() - started)
+            everything.extend(numbers)
+        failures += report("all workers together", everything)
+    if args.restarts:
+        failures += report(f"{args.restarts} restarted containers", restarts(args))
+
+    started = time.perf_counter()
+    legacy = burst(legacy_confirmation_number, args.threads, args.count)
+    elapsed = time.perf_counter() - started
+    print(f"{'legacy (one process)':<26} {len(legacy):>9,} numbers "
+          f"{len(legacy) - len(set(legacy)):>8,} duplicates "
+          f"{'':>14} {len(legacy) / elapsed:>12,.0f}/s")
+    print("most repeated legacy number: "
+          f"{Counter(legacy).most_common(1)[0][1]} times")
+    if failures:
+        raise SystemExit("confirmation numbers were not unique")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,101 @@
+"""
+Offline stand-ins for the webhook's external dependencies.
+
+install() points the FAQ cache at canned worksheet rows (without saving
+them to the FAQ snapshot), the availability engine at an always-free
+calendar, sessions at a fresh in-memory store and confirmation number
+leases at a temporary file, so benchmarks never reach Google, leave
+nothing behind in the working directory and start from a known state.
+"""
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+
+import main
+
+PRESCRIPTION_FAQ = [
+    {
+        "question_keywords": "refill, prescription refill, need a refill, refill my medication",
+        "answer": "You can request a refill by calling us at CLINIC_INFO['phone'] or messaging your practitioner."
+    },
+    {
+        "question_keywords": "pharmacy, change pharmacy, transfer prescription",
+        "answer": "To change your pharmacy, please send us the pharmacy name and address."
+    },
+    {
+        "question_keywords": "side effects, medication side effects, reaction",
+        "answer": "If you have side effects, contact your practitioner. For emergencies call 911."
+    },
+    {
+        "question_keywords": "controlled substance, adderall, stimulant refill",
+        "answer": "Controlled substance refills require a follow-up visit. Call CLINIC_INFO['phone']."
+    },
+]
+
+INSURANCE_FAQ = [
+    {
+        "question_keywords": "do you take my insurance, is my insurance accepted, in network",
+        "answer": "We are in network with most major plans. Call CLINIC_INFO['phone'] to verify your coverage."
+    },
+    {
+        "question_keywords": "superbill, out of network, reimbursement",
+        "answer": "We can send you a superbill to submit to your insurer for out-of-network reimbursement."
+    },
+]
+
+BILLING_FAQ = [
+    {
+        "question_keywords": "how much does it cost, self pay rate, price",
+        "answer": "Self-pay rates depend on the visit type. Call CLINIC_INFO['phone'] for a quote."
+    },
+    {
+        "question_keywords": "payment plan, pay in installments",
+        "answer": "Payment plans are available for balances over $200."
+    },
+]
+
+GENERAL_FAQ = [
+    {
+        "question_keywords": "where are you located, address, parking",
+        "answer": "We see patients by telehealth across our licensed states."
+    },
+    {
+        "question_keywords": "do you treat adhd, conditions treated",
+        "answer": "We treat ADHD, anxiety, depression and more."
+    },
+]
+
+FAKE_WORKSHEETS = {
+    "prescription_faq": PRESCRIPTION_FAQ,
+    "insurance_faq": INSURANCE_FAQ,
+    "billing_faq": BILLING_FAQ,
+    "general_faq": GENERAL_FAQ,
+}
+
+
+def fake_fetch_faq_worksheets(sheet_id):
+    return dict(FAKE_WORKSHEETS)
+
+
+class FreeCalendarSource(main.BusyIntervalSource):
+    """Every practitioner is free all the time"""
+
+    def busy_intervals(self, calendar_id, start, end):
+        return []
+
+
+def install(log_level=logging.WARNING):
+    """Swap every external dependency of main for an in-process fake."""
+    logging.getLogger("main").setLevel(log_level)
+    main.FAQCache.fetcher = staticmethod(fake_fetch_faq_worksheets)
+    main.FAQCache.snapshot = None
+    main.FAQCache.clear()
+    main.FAQCache.refresh(main.SHEET_ID)
+    main.AVAILABILITY.source = FreeCalendarSource()
+    main.AVAILABILITY.clear()
+    main.SessionManager.configure(main.MemorySessionBackend())
+    lease_directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, lease_directory, ignore_errors=True)
+    main.CONFIRMATION_NUMBERS.lease_path = os.path.join(lease_directory, "confirmation.lease")
@@ -0,0 +1,88 @@
+"""
+FAQ matcher benchmark: difflib vs the TF-IDF matrix.
+
+Builds synthetic FAQ worksheets of increasing size (each row has a few
+comma-separated keyword phrases drawn from clinic vocabulary) and times
+index construction and queries for both FAQIndex engines. Queries are
+keywords with a typo, extra words around them, or unrelated text. Also
+reports how often the two engines return the same answer. The TF-IDF
+engine needs numpy.
+
+Run from the repository root:
+
+    python -m benchmarks.faq_matching --rows 50 500 5000
+"""
+import argparse
+import random
+import time
+
+import main
+
+WORDS = ("refill prescription pharmacy medication dose insurance claim "
+         "superbill copay deductible billing payment plan receipt refund "
+         "appointment cancel reschedule telehealth video link portal "
+         "records transfer referral lab results side effects adhd anxiety "
+         "depression therapy provider message fax email hours weekend").split()
+
+
+def synthetic_faq(row_count: int, rng: random.Random):
+    rows = []
+    for n in range(row_count):
+        keywords = [" ".join(rng.sample(WORDS, rng.randint(1, 3)))
+                    for _ in range(rng.randint(1, 4))]
+        rows.append({"question_keywords": ", ".join(keywords),
+                     "answer": f"Answer {n}"})
+    return rows
+
+
+def queries_for(rows, count: int, rng: random.Random):
+    queries = []
+    for _ in range(count):
+        keyword = rng.choice(rng.choice(rows)["question_keywords"].split(", "))
+        kind = rng.random()
+        if kind < 0.4:
+            position = rng.randrange(len(keyword))
+            keyword = keyword[:position] + keyword[position + 1:]
+        elif kind < 0.8:
+            keyword = f"hi i have a question about {keyword} please"
+        else:
+            keyword = " ".join(rng.sample(WORDS, 2)) + " thanks"
+        queries.append(keyword)
+    return queries
+
+
+def time_engine(matcher: str, rows, queries):
+    started = time.perf_counter()
+    index = main.create_faq_index(rows, "555-0100", matcher)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    answers = [index.match(query) for query in queries]
+    per_query = (time.perf_counter() - started) / len(queries)
+    return built, per_query, answers
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if main.np is None:
+        parser.error("the TF-IDF matcher needs numpy")
+
+    print(f"{'rows':>6} {'engine':<8} {'build ms':>9} {'us/query':>10} {'agree':>6}")
+    for row_count in args.rows:
+        rng = random.Random(args.seed)
+        rows = synthetic_faq(row_count, rng)
+        queries = queries_for(rows, args.queries, rng)
+        results = {matcher: time_engine(matcher, rows, queries)
+                   for matcher in ("difflib", "tfidf")}
+        baseline = results["difflib"][2]
+        for matcher, (built, per_query, answers) in results.items():
+            agree = sum(a == b for a, b in zip(answers, baseline)) / len(queries)
+            print(f"{row_count:>6} {matcher:<8} {built * 1000:>9.1f} "
+                  f"{per_query * 1e6:>10.1f} {agree:>6.0%}")
+
+
+if __name__ == "__main__":
+    cli()
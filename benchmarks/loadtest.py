@@ -0,0 +1,252 @@
+"""
+Synthetic multi-turn load test for the webhook.
+
+Simulates many virtual patients walking the new-patient, existing-patient
+and phone-consultation flows turn by turn. Each patient keeps its own
+Dialogflow-style active contexts: lifespans are decremented every turn and
+the response's outputContexts are merged back in. Worker threads pick
+patients from a shared queue and advance them one turn at a time, so
+thousands of conversations are in flight at once.
+
+By default requests go to the in-process Flask app with the fakes from
+benchmarks/fakes.py; --url sends them to a running server instead.
+Reports per-step latency, session-store size and memory growth.
+
+Run from the repository root:
+
+    python -m benchmarks.loadtest --patients 2000 --threads 8
+    python -m benchmarks.loadtest --url http://localhost:8080/webhook
+"""
+import argparse
+import json
+import queue
+import random
+import resource
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+import main
+from benchmarks import fakes
+from benchmarks.replay import summarize
+
+FIRST_NAMES = ["Jane", "John", "Maria", "Wei", "Aisha",
+               "Carlos", "Emily", "Noah", "Priya", "Sam"]
+LAST_NAMES = ["Doe", "Smith", "Garcia", "Chen", "Khan",
+              "Lopez", "Nguyen", "Brown", "Patel", "Lee"]
+INSURERS = ["Aetna", "Cigna", "United Healthcare", "BCBS", "Self-Pay"]
+
+
+def phone(rng):
+    return f"({rng.randint(200, 999)}) 555-{rng.randint(0, 9999):04d}"
+
+
+def licensed_state(rng):
+    return rng.choice(sorted(main.LICENSED_STATES)).title()
+
+
+# A step is (name, intent display name, query text, parameters); the
+# callables receive the patient's random generator.
+FLOWS = {
+    "new_patient": [
+        ("welcome", "Default Welcome Intent", lambda r: "hi", None),
+        ("appointment", "appointment_entry",
+         lambda r: "📅 Schedule Appointment", None),
+        ("patient_type", "new_patient", lambda r: "🆕 New Patient", None),
+        ("name", "collect_new_patient_name",
+         lambda r: f"{r.choice(FIRST_NAMES)} {r.choice(LAST_NAMES)}", None),
+        ("state", "collect_new_patient_state", licensed_state, None),
+        ("insurance", "collect_new_patient_insurance",
+         lambda r: r.choice(INSURERS), None),
+        ("visit_type", "select_new_visit_type",
+         lambda r: "Initial Assessment", None),
+        ("slot", "select_assessment_appointment_slot", lambda r: "1",
+         lambda r: {"number": r.randint(1, 4)}),
+        ("phone", "collect_assessment_phone_final", phone, None),
+        ("done", "", lambda r: "no", None),
+    ],
+    "existing_patient": [
+        ("welcome", "Default Welcome Intent", lambda r: "hi", None),
+        ("appointment", "appointment_entry",
+         lambda r: "📅 Schedule Appointment", None),
+        ("patient_type", "existing_patient_handler",
+         lambda r: "↩️ Existing Patient", None),
+        ("name", "collect_existing_patient_name",
+         lambda r: f"{r.choice(FIRST_NAMES)} {r.choice(LAST_NAMES)}", None),
+        ("practitioner", "collect_existing_patient_practitioner",
+         lambda r: r.choice(["Jodene", "Katherine Robins", "Megan"]), None),
+        ("slot", "select_existing_appointment_slot", lambda r: "1",
+         lambda r: {"number": r.randint(1, 4)}),
+        ("phone", "collect_existing_phone_final", phone, None),
+    ],
+    "phone_consultation": [
+        ("welcome", "Default Welcome Intent", lambda r: "hi", None),
+        ("appointment", "appointment_entry",
+         lambda r: "📅 Schedule Appointment", None),
+        ("patient_type", "new_patient", lambda r: "🆕 New Patient", None),
+        ("name", "collect_new_patient_name",
+         lambda r: f"{r.choice(FIRST_NAMES)} {r.choice(LAST_NAMES)}", None),
+        ("state", "collect_new_patient_state", licensed_state, None),
+        ("insurance", "collect_new_patient_insurance",
+         lambda r: r.choice(INSURERS), None),
+        ("visit_type", "select_new_visit_type",
+         lambda r: "Phone Consultation", None),
+        ("phone", "collect_phone_consultation", phone, None),
+    ],
+}
+
+
+class VirtualPatient:
+    """One conversation: its flow position and active output contexts"""
+
+    def __init__(self, number: int, flow: str, seed: int):
+        self.session_path = f"projects/loadtest/agent/sessions/patient-{number}"
+        self.flow = flow
+        self.step = 0
+        self.rng = random.Random(seed)
+        self.contexts = {}
+
+    @property
+    def done(self) -> bool:
+        return self.step >= len(FLOWS[self.flow])
+
+    def next_request(self):
+        name, intent, text, params = FLOWS[self.flow][self.step]
+        body = {
+            "session": self.session_path,
+            "queryResult": {
+                "queryText": text(self.rng),
+                "intent": {"displayName": intent},
+                "parameters": params(self.rng) if params else {},
+                "outputContexts": list(self.contexts.values())
+            }
+        }
+        return f"{self.flow}:{name}", body
+
+    def receive(self, response):
+        # Dialogflow ages every active context by one turn, then applies
+        # the contexts the webhook returned
+        for context_name in list(self.contexts):
+            context = self.contexts[context_name]
+            context["lifespanCount"] = context.get("lifespanCount", 5) - 1
+            if context["lifespanCount"] <= 0:
+                del self.contexts[context_name]
+        for context in (response or {}).get("outputContexts", []):
+            if context.get("lifespanCount", 5) > 0:
+                self.contexts[context["name"]] = dict(context)
+            else:
+                self.contexts.pop(context["name"], None)
+        self.step += 1
+
+
+class InProcessTarget:
+    """The Flask app in this process, one test client per worker thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def send(self, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = main.app.test_client()
+        return client.post("/webhook", json=body).get_json()
+
+
+class HttpTarget:
+    """A running webhook server"""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def send(self, body):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+
+def max_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(target, patients, thread_count: int):
+    pending = queue.Queue()
+    for patient in patients:
+        pending.put(patient)
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def worker():
+        local_samples = defaultdict(list)
+        while True:
+            try:
+                patient = pending.get_nowait()
+            except queue.Empty:
+                break
+            step, body = patient.next_request()
+            t0 = time.perf_counter()
+            try:
+                response = target.send(body)
+            except Exception:
+                response = None
+                with lock:
+                    errors[step] += 1
+            local_samples[step].append(time.perf_counter() - t0)
+            patient.receive(response)
+            if not patient.done:
+                pending.put(patient)
+        with lock:
+            for step, values in local_samples.items():
+                samples[step].extend(values)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=2000,
+                        help="virtual patients, all in flight together")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--flows", nargs="+", choices=sorted(FLOWS),
+                        default=sorted(FLOWS))
+    parser.add_argument("--url", help="webhook URL of a running server")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        fakes.install()
+        target = InProcessTarget()
+
+    rng = random.Random(args.seed)
+    patients = [VirtualPatient(n, rng.choice(args.flows), rng.random())
+                for n in range(args.patients)]
+    rss_before = max_rss_kb()
+    samples, errors, wall = run(target, patients, args.threads)
+    rss_after = max_rss_kb()
+
+    turns = sum(len(values) for values in samples.values())
+    print(f"{args.patients} patients, {turns} turns, {args.threads} threads: "
+          f"{wall:.2f}s ({turns / wall:,.0f} turns/s)")
+    summarize("per step", samples)
+    if errors:
+        print("\nerrors per step: " + ", ".join(
+            f"{step}={count}" for step, count in sorted(errors.items())))
+    if not args.url:
+        print(f"\nsession store: {main.SessionManager.count()} sessions")
+    print(f"peak RSS: {rss_before / 1024:.1f} MiB -> {rss_after / 1024:.1f} MiB "
+          f"(+{(rss_after - rss_before) / 1024:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    cli()
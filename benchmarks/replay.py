@@ -0,0 +1,153 @@
+"""
+Replay benchmark for recorded Dialogflow webhook payloads.
+
+Reads a JSONL file with one webhook request body per line and replays every
+line through process_message() and through the Flask /webhook endpoint
+(test client), with Google Sheets and Calendar replaced by the fakes in
+benchmarks/fakes.py. Reports p50/p95/p99 latency and requests/sec per
+intent and per handler. Lines without a queryResult are skipped.
+
+Run from the repository root:
+
+    python -m benchmarks.replay
+    python -m benchmarks.replay recorded.jsonl --repeat 50 --mode flask
+"""
+import argparse
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+
+import main
+from benchmarks import fakes
+
+DEFAULT_PAYLOADS = "benchmarks/payloads.jsonl"
+
+
+def load_payloads(path: str):
+    payloads = []
+    skipped = 0
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if isinstance(payload, dict) and "queryResult" in payload:
+                payloads.append(payload)
+            else:
+                skipped += 1
+    return payloads, skipped
+
+
+class HandlerRecorder:
+    """Wraps the routing tables so each request records the first handler it reached."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def wrap(self, handler):
+        name = getattr(handler, "__name__", repr(handler))
+
+        def recorded(*args, **kwargs):
+            if getattr(self._local, "name", None) is None:
+                self._local.name = name
+            return handler(*args, **kwargs)
+        recorded.__name__ = name
+        return recorded
+
+    def install(self):
+        for intent_name, handler in list(main.INTENT_HANDLERS.items()):
+            main.INTENT_HANDLERS[intent_name] = self.wrap(handler)
+        main.FALLBACK_ROUTER.handlers = [
+            self.wrap(handler) for handler in main.FALLBACK_ROUTER.handlers]
+
+    def start(self):
+        self._local.name = None
+
+    def finish(self) -> str:
+        # Requests routed straight from process_message (context routing)
+        # never pass through a table
+        return self._local.name or "process_message"
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+def summarize(title: str, samples):
+    print(f"\n{title}")
+    print(f"{'':<44} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>10}")
+    for name in sorted(samples, key=lambda n: -sum(samples[n])):
+        values = sorted(samples[name])
+        total = sum(values)
+        rate = len(values) / total if total else 0.0
+        print(f"{name[:44]:<44} {len(values):>7} {percentile(values, 50) * 1000:>9.3f} "
+              f"{percentile(values, 95) * 1000:>9.3f} {percentile(values, 99) * 1000:>9.3f} "
+              f"{rate:>10,.0f}")
+
+
+def replay(payloads, repeat: int, mode: str, recorder: HandlerRecorder):
+    by_intent = defaultdict(list)
+    by_handler = defaultdict(list)
+    client = main.app.test_client() if mode == "flask" else None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            intent_name = payload["queryResult"].get(
+                "intent", {}).get("displayName", "") or "(none)"
+            recorder.start()
+            t0 = time.perf_counter()
+            if client is not None:
+                client.post("/webhook", json=payload)
+            else:
+                with main.SessionManager.transaction():
+                    main.process_message(payload)
+            elapsed = time.perf_counter() - t0
+            by_intent[intent_name].append(elapsed)
+            by_handler[recorder.finish()].append(elapsed)
+    wall = time.perf_counter() - started
+    return by_intent, by_handler, wall
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("payloads", nargs="?", default=DEFAULT_PAYLOADS,
+                        help="JSONL file of webhook request bodies")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="times to replay the whole file")
+    parser.add_argument("--mode", choices=["process_message", "flask", "both"],
+                        default="both")
+    args = parser.parse_args()
+
+    payloads, skipped = load_payloads(args.payloads)
+    if not payloads:
+        parser.error(f"no webhook payloads found in {args.payloads}")
+    fakes.install()
+    recorder = HandlerRecorder()
+    recorder.install()
+
+    print(f"{len(payloads)} payloads from {args.payloads}"
+          f" ({skipped} lines skipped), replayed {args.repeat}x")
+    modes = ["process_message", "flask"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        by_intent, by_handler, wall = replay(
+            payloads, args.repeat, mode, recorder)
+        count = len(payloads) * args.repeat
+        print(f"\n=== {mode}: {count} requests in {wall:.3f}s "
+              f"({count / wall:,.0f} req/s)")
+        summarize("per intent", by_intent)
+        summarize("per handler", by_handler)
+
+
+if __name__ == "__main__":
+    cli()
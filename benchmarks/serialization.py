@@ -0,0 +1,88 @@
+"""
+Webhook serialization micro-benchmark.
+
+For every payload in a JSONL recording (default benchmarks/payloads.jsonl)
+the response is produced once with process_message; then decoding the
+request body and encoding the response are timed on their own:
+
+    before  request.get_json(force=True) + jsonify(response)
+    after   JSON_CODEC.loads(body) + json_response(response) with the
+            json and (if installed) orjson codecs
+
+Run from the repository root:
+
+    python -m benchmarks.serialization --rounds 2000
+"""
+import argparse
+import json
+import time
+
+import main
+from benchmarks import fakes
+from benchmarks.replay import DEFAULT_PAYLOADS, load_payloads
+
+
+def time_before(bodies, responses, rounds: int) -> float:
+    total = 0.0
+    for body, response in zip(bodies, responses):
+        with main.app.test_request_context(
+                "/webhook", method="POST", data=body,
+                content_type="application/json"):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                # get_json caches per request; clear it to decode every round
+                main.request._cached_json = (Ellipsis, Ellipsis)
+                main.request.get_json(force=True)
+                main.jsonify(response).get_data()
+            total += time.perf_counter() - start
+    return total
+
+
+def time_after(codec, bodies, responses, rounds: int) -> float:
+    main.JSON_CODEC = codec
+    main._chips_message.cache_clear()
+    main._cards_message.cache_clear()
+    total = 0.0
+    for body, response in zip(bodies, responses):
+        # Rebuild so pre-encoded parts come from the codec under test
+        response = main.process_message(json.loads(body))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            codec.loads(body)
+            main.json_response(response).get_data()
+        total += time.perf_counter() - start
+    return total
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("payloads", nargs="?", default=DEFAULT_PAYLOADS)
+    parser.add_argument("--rounds", type=int, default=1000,
+                        help="timed repetitions per payload")
+    args = parser.parse_args()
+
+    fakes.install()
+    payloads, _ = load_payloads(args.payloads)
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+    responses = [main.process_message(payload) for payload in payloads]
+    count = len(bodies) * args.rounds
+
+    results = [("before (get_json + jsonify)",
+                time_before(bodies, responses, args.rounds))]
+    codecs = [main.StdlibJSONCodec()]
+    if main.orjson is not None:
+        codecs.append(main.OrjsonCodec())
+    for codec in codecs:
+        results.append((f"after ({codec.name})",
+                        time_after(codec, bodies, responses, args.rounds)))
+
+    print(f"{len(bodies)} payloads x {args.rounds} rounds, "
+          f"mean body {sum(map(len, bodies)) / len(bodies):.0f} bytes")
+    baseline = results[0][1]
+    for name, total in results:
+        print(f"{name:<30} {total / count * 1e6:>8.2f} us/request "
+              f"{baseline / total:>6.1f}x")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,122 @@
+"""
+Session store memory benchmark.
+
+Fills each store layout with N intake sessions (names, state, insurance,
+phone and confirmation number, as the new-patient flow leaves them) and
+reports the bytes allocated per session, measured with tracemalloc. The
+values themselves are the same in every layout, so the differences come
+from how sessions and their timestamps are held:
+
+    legacy   defaultdict(dict) plus a datetime per session in a second dict
+    dicts    sharded store keeping a dict per session and two float dicts
+    records  MemorySessionBackend: one __slots__ SessionRecord per session
+
+Run from the repository root:
+
+    python -m benchmarks.session_memory --sessions 100000
+"""
+import argparse
+import gc
+import heapq
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+from main import MemorySessionBackend
+
+
+def intake(n: int):
+    return {
+        "flow": "appointment",
+        "patient_type": "new",
+        "first_name": f"Jane{n}",
+        "last_name": f"Doe{n}",
+        "patient_name": f"Jane{n} Doe{n}",
+        "patient_state": "FL",
+        "insurance_type": "Aetna",
+        "phone_number": f"(555) {n % 1000:03d}-{n % 10000:04d}",
+        "confirmation_number": f"SBH{n:09d}",
+    }
+
+
+class LegacyStore:
+    """The original layout, before sharding"""
+
+    def __init__(self):
+        self.sessions = defaultdict(dict)
+        self.last_activity = defaultdict(lambda: datetime.now())
+
+    def apply(self, session_id, changes):
+        self.sessions[session_id].update(changes)
+        self.last_activity[session_id] = datetime.now()
+
+
+class DictShardStore:
+    """The sharded layout before session records: dicts keyed by session id"""
+
+    def __init__(self, shard_count: int = 16):
+        self.shards = [({}, {}, {}, []) for _ in range(shard_count)]
+
+    def apply(self, session_id, changes):
+        sessions, last_activity, queued, expiry = self.shards[
+            hash(session_id) % len(self.shards)]
+        now = time.monotonic()
+        last_activity[session_id] = now
+        if session_id not in queued:
+            queued[session_id] = now
+            heapq.heappush(expiry, (now, session_id))
+        sessions.setdefault(session_id, {}).update(changes)
+
+
+class RecordStore:
+    def __init__(self):
+        self.backend = MemorySessionBackend()
+
+    def apply(self, session_id, changes):
+        self.backend.apply(session_id, changes)
+
+
+LAYOUTS = {
+    "legacy": LegacyStore,
+    "dicts": DictShardStore,
+    "records": RecordStore,
+}
+
+
+def measure(layout, session_count: int) -> float:
+    """Bytes allocated per session, values included."""
+    ids = [f"projects/p/agent/sessions/{n:012d}" for n in range(session_count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = layout()
+    for n, session_id in enumerate(ids):
+        # Each turn of the intake writes one or two keys
+        for key, value in intake(n).items():
+            store.apply(session_id, {key: value})
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del store
+    return used / session_count
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--layouts", nargs="+", choices=list(LAYOUTS),
+                        default=list(LAYOUTS))
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions")
+    print(f"{'layout':<8} {'bytes/session':>14} {'vs legacy':>10}")
+    baseline = None
+    for name in args.layouts:
+        per_session = measure(LAYOUTS[name], args.sessions)
+        baseline = baseline or per_session
+        print(f"{name:<8} {per_session:>14,.0f} {per_session / baseline:>9.0%}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,75 @@
+"""
+Session snapshot restore check.
+
+Runs the memory backend with a one-session capacity against a snapshot in
+a temporary directory, so every new session evicts the previous one, and
+checks that an evicted session comes back with its newest data: after a
+compaction and a later save, before its changes were saved at all, after
+a deletion, and in a new process-like backend reopening the snapshot.
+Exits non-zero on the first mismatch.
+
+Run from the repository root:
+
+    python -m benchmarks.session_restore
+"""
+import atexit
+import os
+import tempfile
+import time
+
+from main import MemorySessionBackend, SessionSnapshot
+
+
+def backend(path: str) -> MemorySessionBackend:
+    # One shard holding one session; sessions idle for any time are evictable
+    store = MemorySessionBackend(shard_count=1, max_sessions=1, min_idle=0,
+                                 snapshot=SessionSnapshot(path), save_interval=3600)
+    # The snapshot directory is gone by exit
+    atexit.unregister(store.save)
+    return store
+
+
+def evict(store: MemorySessionBackend, other: str = "B"):
+    time.sleep(0.001)
+    store.apply(other, {"flow": "other"})
+
+
+def check(name: str, got, expected):
+    status = "ok" if got == expected else "FAILED"
+    print(f"{name:<48} {status}")
+    if got != expected:
+        raise SystemExit(f"{name}: expected {expected!r}, got {got!r}")
+
+
+def cli():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.snapshot")
+
+        store = backend(path)
+        store.apply("A", {"flow": "v1"})
+        store.save(compact=True)
+        store.apply("A", {"flow": "v2"})
+        store.save()
+        evict(store)
+        check("saved after compaction, evicted, restored", store.load("A"), {"flow": "v2"})
+
+        store.apply("A", {"flow": "v3"})
+        evict(store)
+        check("evicted before saving, restored", store.load("A"), {"flow": "v3"})
+
+        store.apply("A", {"flow": "v4"})
+        evict(store)
+        store.save()
+        check("evicted before saving, saved, restored", store.load("A"), {"flow": "v4"})
+
+        store.save(compact=True)
+        check("reopened snapshot", backend(path).load("A"), {"flow": "v4"})
+
+        store.delete("A")
+        store.save()
+        evict(store)
+        check("deleted, saved, evicted", store.load("A"), {})
+
+
+if __name__ == "__main__":
+    cli()
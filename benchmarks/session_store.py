@@ -0,0 +1,130 @@
+"""
+SessionManager throughput benchmark.
+
+Pre-fills the store with N live sessions, then has T threads run a mix of
+set/get calls on random sessions and reports operations per second. The
+sharded in-memory backend and the SQLite backend are compared against the
+previous single-lock store, whose every set scanned all sessions for expiry.
+
+Run from the repository root:
+
+    python -m benchmarks.session_store
+    python -m benchmarks.session_store --sessions 1000 10000 50000 --threads 1 4 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from main import MemorySessionBackend, SessionManager, SqliteSessionBackend
+
+
+class LegacySessionManager:
+    """The pre-sharding store: one lock, full expiry scan on every set"""
+    _sessions = defaultdict(dict)
+    _lock = threading.Lock()
+    _last_activity = defaultdict(lambda: datetime.now())
+
+    @classmethod
+    def get(cls, session_id, key=None, default=None):
+        with cls._lock:
+            cls._last_activity[session_id] = datetime.now()
+            if key:
+                return cls._sessions[session_id].get(key, default)
+            return cls._sessions[session_id]
+
+    @classmethod
+    def set(cls, session_id, key, value):
+        with cls._lock:
+            cls._sessions[session_id][key] = value
+            cls._last_activity[session_id] = datetime.now()
+            cutoff = datetime.now() - timedelta(hours=24)
+            expired = [sid for sid, last in cls._last_activity.items()
+                       if last < cutoff]
+            for sid in expired:
+                cls._sessions.pop(sid, None)
+                cls._last_activity.pop(sid, None)
+
+    @classmethod
+    def reset(cls):
+        cls._sessions = defaultdict(dict)
+        cls._last_activity = defaultdict(lambda: datetime.now())
+
+
+def memory_store():
+    SessionManager.configure(MemorySessionBackend())
+    return SessionManager
+
+
+def sqlite_store():
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    SessionManager.configure(SqliteSessionBackend(path))
+    return SessionManager
+
+
+STORES = {
+    "memory": memory_store,
+    "sqlite": sqlite_store,
+    "legacy": lambda: LegacySessionManager,
+}
+
+
+def run(store, session_count: int, thread_count: int, ops: int) -> float:
+    """Returns operations per second for `ops` calls split across threads."""
+    store.reset()
+    ids = [f"bench-{i}" for i in range(session_count)]
+    for session_id in ids:
+        store.set(session_id, "flow", "appointment")
+
+    per_thread = max(1, ops // thread_count)
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        barrier.wait()
+        for n in range(per_thread):
+            session_id = rng.choice(ids)
+            if n % 2:
+                store.get(session_id, "flow")
+            else:
+                store.set(session_id, "step", n)
+
+    threads = [threading.Thread(target=worker, args=(seed,))
+               for seed in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    store.reset()
+    return per_thread * thread_count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, nargs="+",
+                        default=[1000, 10000, 50000])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=4000,
+                        help="operations per run, split across threads")
+    parser.add_argument("--stores", nargs="+", choices=sorted(STORES),
+                        default=["memory", "sqlite", "legacy"])
+    args = parser.parse_args()
+
+    print(f"{'store':<8} {'sessions':>9} {'threads':>7} {'ops/sec':>12}")
+    for name in args.stores:
+        for session_count in args.sessions:
+            for thread_count in args.threads:
+                rate = run(STORES[name](), session_count,
+                           thread_count, args.ops)
+                print(f"{name:<8} {session_count:>9} {thread_count:>7} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,63 @@
 # TOP-LEVEL IMPORTS & GLOBALS
 # ============================================================================
 import os
-from flask import Flask, request, jsonify
+import asyncio
+import functools
+import json
+import sqlite3
+from flask import Flask, Response, request, jsonify
 import string
 import threading
+import time
 import logging
+import logging.handlers
+import atexit
+import queue
 from typing import Dict
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession, Request
 import gspread
-from collections import defaultdict
+import requests
+from requests.adapters import HTTPAdapter
+from collections import defaultdict, Counter
 import random
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Callable, Optional
 import re
-from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from types import MappingProxyType
+from datetime import datetime, timedelta, timezone
+
+from bisect import bisect_left, bisect_right
+import hashlib
+import heapq
+import itertools
+import weakref
+import mmap
+import struct
+from difflib import SequenceMatcher
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-from difflib import SequenceMatcher
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ============================================================================
@@ -122,70 +161,1492 @@ ENCOURAGEMENT_MESSAGES = [
 
 SHEET_ID = "14v55dbwfn1EmHUcJV47dbXZrLVVOPj9Fj8J-_Jmk75A"
 
+# Worksheets of SHEET_ID that answer free-text questions in each menu area
+FAQ_WORKSHEETS = {
+    "prescription": "prescription_faq",
+    "insurance": "insurance_faq",
+    "billing": "billing_faq",
+    "general_information": "general_faq",
+}
+
+# How long a cached FAQ worksheet is served before the background refresher
+# re-reads it, and how soon a failed refresh is retried.
+FAQ_CACHE_TTL_SECONDS = float(os.environ.get("FAQ_CACHE_TTL_SECONDS", 300))
+FAQ_CACHE_RETRY_SECONDS = float(os.environ.get("FAQ_CACHE_RETRY_SECONDS", 30))
+
+# Every FAQ load that changes the worksheets is saved to FAQ_SNAPSHOT_PATH,
+# and the saved copy is served from import until the sheet has been re-read,
+# so a restart needs no network; an empty path turns this off.
+FAQ_SNAPSHOT_PATH = os.environ.get("FAQ_SNAPSHOT_PATH", "faq.snapshot")
+
+# "difflib" compares the query with FAQ keywords one at a time; "tfidf"
+# scores all keywords at once with a character n-gram TF-IDF matrix (needs
+# numpy, uses scipy.sparse if installed) and falls back to difflib without
+# numpy. TF-IDF cosine scores need their own threshold.
+FAQ_MATCHER = os.environ.get("FAQ_MATCHER", "difflib")
+FAQ_TFIDF_THRESHOLD = float(os.environ.get("FAQ_TFIDF_THRESHOLD", 0.5))
+
+# Sessions idle for longer than this are dropped. The store is split into
+# independently locked shards so request threads rarely wait on each other.
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", 24 * 60 * 60))
+SESSION_SHARD_COUNT = int(os.environ.get("SESSION_SHARD_COUNT", 16))
+
+# The memory backend holds at most SESSION_MAX_COUNT sessions. When full, a
+# new session replaces the least recently used one if that has been idle for
+# SESSION_EVICT_MIN_IDLE_SECONDS, and is turned away otherwise.
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", 100000))
+SESSION_EVICT_MIN_IDLE_SECONDS = float(
+    os.environ.get("SESSION_EVICT_MIN_IDLE_SECONDS", 300))
+
+# "memory" keeps sessions in this process (single gunicorn worker only);
+# "sqlite" shares them between workers through a WAL-mode database file.
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH", "sessions.db")
+# How often each worker deletes SQLite sessions idle past SESSION_TTL_SECONDS
+SESSION_CLEANUP_INTERVAL_SECONDS = float(
+    os.environ.get("SESSION_CLEANUP_INTERVAL_SECONDS", 300))
+
+# With SESSION_SNAPSHOT_PATH set, the memory backend saves changed sessions
+# there every SESSION_SNAPSHOT_INTERVAL_SECONDS and restores them after a
+# restart. Off by default: the file holds patient details unencrypted, so
+# only point it at protected storage. The change journal is folded into the
+# snapshot once it exceeds SESSION_JOURNAL_MAX_BYTES.
+SESSION_SNAPSHOT_PATH = os.environ.get("SESSION_SNAPSHOT_PATH", "")
+SESSION_SNAPSHOT_INTERVAL_SECONDS = float(
+    os.environ.get("SESSION_SNAPSHOT_INTERVAL_SECONDS", 5))
+SESSION_JOURNAL_MAX_BYTES = int(
+    os.environ.get("SESSION_JOURNAL_MAX_BYTES", 4 * 1024 * 1024))
+
+try:
+    from zoneinfo import ZoneInfo
+    CLINIC_TZ = ZoneInfo(os.environ.get("CLINIC_TIMEZONE", "America/New_York"))
+except Exception:
+    CLINIC_TZ = timezone(timedelta(hours=-5), "EST")
+
+# Appointment grid: start hours (clinic time) offered on weekdays
+APPOINTMENT_HOURS = [9, 10, 11, 14, 15, 16]
+APPOINTMENT_SLOT_MINUTES = 60
+
+# Practitioner busy time comes from Google Calendar ("google") or from a
+# local JSON file ("file"), and is reused for AVAILABILITY_CACHE_TTL_SECONDS.
+AVAILABILITY_SOURCE = os.environ.get("AVAILABILITY_SOURCE", "google")
+AVAILABILITY_FILE = os.environ.get("AVAILABILITY_FILE", "busy_intervals.json")
+AVAILABILITY_CACHE_TTL_SECONDS = float(
+    os.environ.get("AVAILABILITY_CACHE_TTL_SECONDS", 60))
+AVAILABILITY_HORIZON_DAYS = int(os.environ.get("AVAILABILITY_HORIZON_DAYS", 21))
+# A calendar that failed to load and has no earlier copy is retried this soon
+AVAILABILITY_RETRY_SECONDS = float(os.environ.get("AVAILABILITY_RETRY_SECONDS", 10))
+
+# Confirmation numbers take their worker prefix from blocks leased through
+# this file, which every worker process in the container shares. It needs
+# no volume: leases follow the clock, so a fresh file never reuses prefixes.
+CONFIRMATION_LEASE_PATH = os.environ.get("CONFIRMATION_LEASE_PATH", "confirmation.lease")
+
+# Sheets and Calendar calls share one authorized session whose pool keeps up
+# to GOOGLE_HTTP_POOL_SIZE connections alive; its access token is renewed
+# GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS before it expires.
+GOOGLE_SERVICE_ACCOUNT_FILE = os.environ.get(
+    "GOOGLE_SERVICE_ACCOUNT_FILE", "service_account.json")
+GOOGLE_HTTP_POOL_SIZE = int(os.environ.get("GOOGLE_HTTP_POOL_SIZE", 10))
+GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS = float(
+    os.environ.get("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", 300))
+
+# "auto" uses orjson when installed and falls back to the json module
+JSON_CODEC_NAME = os.environ.get("JSON_CODEC", "auto")
+
+# LOG_FORMAT is "text" or "json" (one object per line). Records go through a
+# bounded queue to a background writer and are dropped when it is full.
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+
+# Fraction of webhook requests that get a request log line, overall and per
+# intent, e.g. LOG_SAMPLE_RATES="Default Welcome Intent=0.01,prescription_entry=1"
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+
+# ============================================================================
+# PROVIDER DIRECTORY
+# ============================================================================
+
+
+class ProviderDirectory:
+    """
+    Read-only inverted indexes over the practitioner roster, built once.
+
+    Each index maps a lowercase key (state abbreviation or full state name,
+    specialty, insurance carrier) to a frozenset of practitioner ids, so a
+    compound query is a set intersection. A practitioner without an
+    "insurance" list takes every carrier the clinic accepts.
+    """
+
+    def __init__(self, practitioners: Dict, licensed_states: Dict, insurance_accepted: List[str]):
+        self.practitioners = practitioners
+        self._order = {practitioner_id: i for i,
+                       practitioner_id in enumerate(practitioners)}
+        by_state = defaultdict(set)
+        by_specialty = defaultdict(set)
+        by_insurance = defaultdict(set)
+        for practitioner_id, practitioner in practitioners.items():
+            for state in practitioner.get("states", []):
+                by_state[state.lower()].add(practitioner_id)
+            for specialty in practitioner.get("specialties", []):
+                by_specialty[specialty.lower()].add(practitioner_id)
+            for carrier in practitioner.get("insurance", insurance_accepted):
+                by_insurance[carrier.lower()].add(practitioner_id)
+        self._state_abbreviations = {
+            state: state.upper() for state in by_state}
+        for name, abbr in licensed_states.items():
+            self._state_abbreviations[name] = abbr
+            by_state[name] = by_state.get(abbr.lower(), set())
+        self.by_state = MappingProxyType(
+            {key: frozenset(ids) for key, ids in by_state.items()})
+        self.by_specialty = MappingProxyType(
+            {key: frozenset(ids) for key, ids in by_specialty.items()})
+        self.by_insurance = MappingProxyType(
+            {key: frozenset(ids) for key, ids in by_insurance.items()})
+        self._everyone = frozenset(practitioners)
+
+    def state_abbreviation(self, state: str) -> Optional[str]:
+        """Abbreviation for a state name or abbreviation we know, else None."""
+        return self._state_abbreviations.get(state.strip().lower())
+
+    def find(self, state: str = None, specialty: str = None, insurance: str = None) -> List[str]:
+        """Ids of practitioners matching every given criterion, in roster order."""
+        matches = []
+        for index, value in ((self.by_state, state),
+                             (self.by_specialty, specialty),
+                             (self.by_insurance, insurance)):
+            if value is not None:
+                matches.append(index.get(value.strip().lower(), frozenset()))
+        if not matches:
+            return list(self.practitioners)
+        matches.sort(key=len)
+        ids = matches[0].intersection(*matches[1:])
+        return sorted(ids, key=self._order.__getitem__)
+
+
+PROVIDER_DIRECTORY = ProviderDirectory(
+    PRACTITIONERS, LICENSED_STATES, INSURANCE_ACCEPTED)
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+# Histogram bucket upper bounds in seconds (Prometheus "le")
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Prometheus histogram with an optional single label.
+
+    Every thread records into its own {label value: counts} table, so
+    observe() never takes a lock; collect() sums the tables of all threads
+    when /metrics is scraped. A table holds one count per bucket plus the
+    +Inf bucket, followed by the sum of observed values. Tables of threads
+    that have finished are folded into `_retired` when a new thread
+    registers and at scrape time, so thread churn does not grow the list.
+    """
+
+    def __init__(self, name: str, documentation: str, label: str = None,
+                 buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._local = threading.local()
+        # (weak reference to the owning thread, table)
+        self._tables = []
+        self._retired = {}
+        self._tables_lock = threading.Lock()
+
+    def _table(self) -> Dict:
+        table = getattr(self._local, "table", None)
+        if table is None:
+            table = self._local.table = {}
+            with self._tables_lock:
+                self._retire_finished()
+                self._tables.append((weakref.ref(threading.current_thread()), table))
+        return table
+
+    @staticmethod
+    def _add(totals: Dict, table: Dict):
+        for label_value, counts in list(table.items()):
+            total = totals.get(label_value)
+            if total is None:
+                totals[label_value] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    total[i] += count
+
+    def _retire_finished(self):
+        """Fold the tables of finished threads into _retired; call with _tables_lock held."""
+        live = []
+        for thread_ref, table in self._tables:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live.append((thread_ref, table))
+            else:
+                self._add(self._retired, table)
+        self._tables = live
+
+    def observe(self, seconds: float, label_value: str = ""):
+        table = self._table()
+        counts = table.get(label_value)
+        if counts is None:
+            counts = table[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    @contextmanager
+    def timer(self, label_value: str = ""):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, label_value)
+
+    def collect(self) -> Dict[str, List]:
+        """Per-bucket counts and sum for each label value, over all threads."""
+        with self._tables_lock:
+            self._retire_finished()
+            tables = [table for _, table in self._tables]
+            totals = {label_value: list(counts)
+                      for label_value, counts in self._retired.items()}
+        for table in tables:
+            self._add(totals, table)
+        return totals
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        for label_value, counts in sorted(self.collect().items()):
+            labels = ""
+            if self.label:
+                escaped = (label_value.replace("\\", "\\\\")
+                           .replace('"', '\\"').replace("\n", "\\n"))
+                labels = f'{self.label}="{escaped}",'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            labels = "{" + labels.rstrip(",") + "}" if labels else ""
+            lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Counter or gauge read from `callback` at scrape time.
+
+    The callback returns {label value: number}; use "" as the only key for
+    a metric without a label.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 callback, label: str = None):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.callback = callback
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        for label_value, value in sorted(self.callback().items()):
+            labels = f'{{{self.label}="{label_value}"}}' if self.label else ""
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class TimedLock:
+    """threading.Lock whose `with` block records the time spent waiting for it"""
+    __slots__ = ("_lock", "_histogram", "_label")
+
+    def __init__(self, histogram: Histogram, label_value: str = ""):
+        self._lock = threading.Lock()
+        self._histogram = histogram
+        self._label = label_value
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self._lock.acquire()
+        self._histogram.observe(time.perf_counter() - started, self._label)
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+HANDLER_LATENCY = Histogram(
+    "webhook_handler_seconds", "Time spent in each intent handler.", "handler")
+FAQ_LOOKUP_LATENCY = Histogram(
+    "faq_lookup_seconds", "Time to match a query against an FAQ worksheet.")
+SESSION_LOCK_WAIT = Histogram(
+    "session_lock_wait_seconds",
+    "Time spent waiting for a session store lock.", "backend")
+SERIALIZATION_LATENCY = Histogram(
+    "webhook_serialization_seconds",
+    "Time to decode webhook requests and encode responses.", "operation")
+
+METRICS = [HANDLER_LATENCY, FAQ_LOOKUP_LATENCY,
+           SESSION_LOCK_WAIT, SERIALIZATION_LATENCY]
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_metrics() -> bytes:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode()
+
+
+def timed_handler(handler):
+    """Record every call of an intent handler in HANDLER_LATENCY."""
+    name = getattr(handler, "__name__", repr(handler))
+
+    @functools.wraps(handler)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+    return timed
+
+# ============================================================================
+# LOGGING
+# ============================================================================
+
+PHONE_PATTERN = re.compile(
+    r"(?<!\d)(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)")
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+NAME_PHRASE_PATTERN = re.compile(
+    r"\b(my name is|my name's|name is|this is)\s+[^\W\d]+(?:\s+[^\W\d]+)?",
+    re.IGNORECASE)
+
+# Intents and contexts in which the whole query text is the patient's name
+NAME_INTENTS = frozenset(
+    {"collect_new_patient_name", "collect_existing_patient_name"})
+
+
+def redact(text: str) -> str:
+    """Mask phone numbers, email addresses and introduced names in free text."""
+    text = PHONE_PATTERN.sub("[phone]", text)
+    text = EMAIL_PATTERN.sub("[email]", text)
+    return NAME_PHRASE_PATTERN.sub(r"\1 [name]", text)
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Redacts a record's message and structured fields before it is written.
+
+    Attached to the output handler, so the work happens on the log writer
+    thread. The "query" field is masked entirely when the record's intent
+    or one of its contexts collects the patient's name.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        fields = getattr(record, "fields", None)
+        if fields:
+            fields = dict(fields)
+            for key, value in fields.items():
+                if isinstance(value, str):
+                    fields[key] = redact(value)
+            names = NAME_INTENTS.intersection(fields.get("contexts", ()))
+            if fields.get("query") and (fields.get("intent") in NAME_INTENTS or names):
+                fields["query"] = "[name]"
+            record.fields = fields
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, with structured fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__(logging.BASIC_FORMAT)
+
+    def formatException(self, exc_info) -> str:
+        return redact(super().formatException(exc_info))
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; structured fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread as they are, without formatting them.
+
+    The queue is bounded; when it is full the record is dropped and counted
+    instead of blocking the request thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """Per-intent sampling rates parsed from "intent=rate,intent=rate"."""
+
+    def __init__(self, default_rate: float = 1.0, rates: str = ""):
+        self.default_rate = default_rate
+        self.rates = {}
+        for item in rates.split(","):
+            intent_name, _, rate = item.rpartition("=")
+            if intent_name.strip():
+                self.rates[intent_name.strip()] = float(rate)
+
+    def sample(self, intent_name: str) -> bool:
+        rate = self.rates.get(intent_name, self.default_rate)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+REQUEST_LOG_SAMPLER = LogSampler(LOG_SAMPLE_RATE, LOG_SAMPLE_RATES)
+
+
+def configure_logging() -> Optional[logging.handlers.QueueListener]:
+    """
+    Route the root logger through a bounded queue to a background writer.
+
+    Like logging.basicConfig, does nothing if the root logger already has
+    handlers (e.g. set up by the embedding server).
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    output.addFilter(RedactingFilter())
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+LOG_LISTENER = configure_logging()
+
 # ============================================================================
 # SESSION MANAGEMENT
 # ============================================================================
 
 
+# Session keys the handlers use; SessionRecord stores these in slots
+SESSION_FIELDS = (
+    "flow", "patient_type", "first_name", "last_name", "patient_name",
+    "patient_state", "insurance_type", "practitioner_id", "appointment_slots",
+    "appointment_date", "appointment_time", "phone_number",
+    "confirmation_number", "consultation_phone", "consultation_requested",
+)
+_SESSION_FIELD_SET = frozenset(SESSION_FIELDS)
+_UNSET = object()
+
+
+class SessionRecord:
+    """
+    One session of the memory backend.
+
+    Known keys live in slots (an unset slot stays empty) and any other key
+    in `extra`, which is only created when needed. `last_activity` and
+    `queued` are time.monotonic() values; see SessionShard.
+    """
+    __slots__ = SESSION_FIELDS + ("last_activity", "queued", "extra")
+
+    def __init__(self, now: float):
+        self.last_activity = now
+        self.queued = now
+        self.extra = None
+
+    def get(self, key: str, default=None):
+        if key in _SESSION_FIELD_SET:
+            return getattr(self, key, default)
+        return self.extra.get(key, default) if self.extra else default
+
+    def update(self, changes: Dict):
+        for key, value in changes.items():
+            if key in _SESSION_FIELD_SET:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def replace(self, data: Dict):
+        for key in SESSION_FIELDS:
+            if hasattr(self, key):
+                delattr(self, key)
+        self.extra = None
+        self.update(data)
+
+    def to_dict(self) -> Dict:
+        data = {}
+        for key in SESSION_FIELDS:
+            value = getattr(self, key, _UNSET)
+            if value is not _UNSET:
+                data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class SessionShard:
+    """
+    One lock-protected slice of the in-memory session store.
+
+    `expiry` is a min-heap of (timestamp, session_id) with one live entry per
+    session; the record's `queued` is the timestamp of that entry. Activity
+    only updates `last_activity`, and an entry whose session was touched
+    since it was queued is pushed back with the newer timestamp when it
+    reaches the top, so a cleanup only pops sessions that are (or were) due,
+    and the top current entry is the least recently used session.
+    `dirty` holds the sessions written or deleted since the last snapshot
+    save, and `unsaved` the records of dirty sessions evicted before that
+    save; `expired`, `evicted` and `rejected` count sessions dropped by TTL,
+    dropped to make room, and turned away because the shard was full.
+    """
+    __slots__ = ("lock", "sessions", "expiry", "dirty", "unsaved",
+                 "expired", "evicted", "rejected")
+
+    def __init__(self):
+        self.lock = TimedLock(SESSION_LOCK_WAIT, "memory")
+        self.sessions = {}
+        self.expiry = []
+        self.dirty = set()
+        self.unsaved = {}
+        self.expired = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def add(self, session_id: str, now: float) -> SessionRecord:
+        record = self.sessions[session_id] = SessionRecord(now)
+        heapq.heappush(self.expiry, (now, session_id))
+        return record
+
+    def discard(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self.unsaved.pop(session_id, None)
+
+    def _pop_oldest(self, cutoff: float) -> Optional[tuple]:
+        """
+        Drop the least recently used session if it was last used before
+        cutoff, returning its (session_id, record).
+        """
+        while self.expiry and self.expiry[0][0] < cutoff:
+            queued_at, session_id = heapq.heappop(self.expiry)
+            record = self.sessions.get(session_id)
+            if record is None or record.queued != queued_at:
+                continue  # stale entry for a deleted session
+            if record.last_activity < cutoff:
+                del self.sessions[session_id]
+                return session_id, record
+            record.queued = record.last_activity
+            heapq.heappush(self.expiry, (record.queued, session_id))
+        return None
+
+    def expire(self, cutoff: float) -> int:
+        expired = 0
+        while self._pop_oldest(cutoff):
+            expired += 1
+        self.expired += expired
+        return expired
+
+    def evict(self, cutoff: float) -> bool:
+        """
+        Make room for one session by dropping the LRU one, if idle since
+        cutoff. An evicted session with unsaved changes is kept in
+        `unsaved` until the next snapshot save.
+        """
+        evicted = self._pop_oldest(cutoff)
+        if evicted is None:
+            return False
+        session_id, record = evicted
+        if session_id in self.dirty:
+            self.unsaved[session_id] = record
+        self.evicted += 1
+        return True
+
+
+class SessionBackend:
+    """
+    Storage interface behind SessionManager.
+
+    `apply` merges `changes` into a session (or replaces it when `replace`
+    is set) atomically; `apply_many` does the same for several sessions in
+    one batch. `load` returns a copy of the session as a dict, empty when
+    unknown.
+    """
+
+    def load(self, session_id: str) -> Dict:
+        raise NotImplementedError
+
+    def get(self, session_id: str, key: str, default=None):
+        return self.load(session_id).get(key, default)
+
+    def apply(self, session_id: str, changes: Dict, replace: bool = False):
+        raise NotImplementedError
+
+    def apply_many(self, batch: Dict[str, tuple]):
+        """Apply {session_id: (changes, replace)} for several sessions."""
+        for session_id, (changes, replace) in batch.items():
+            self.apply(session_id, changes, replace)
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def cleanup(self, ttl: float) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        """Store counters for /metrics; backends without any return {}."""
+        return {}
+
+    def reset(self):
+        raise NotImplementedError
+
+
+class SessionSnapshot:
+    """
+    On-disk copy of the memory backend: a compacted snapshot file plus an
+    append-only journal of the sessions saved since it was written.
+
+    Both hold [session_id, saved_at, data] JSON records, with null data for
+    a deleted session in the journal. The snapshot ends with an index of
+    (key hash, offset, length, saved_at) entries sorted by hash and a
+    footer; it is memory-mapped and binary-searched in place, so opening it
+    costs the same whatever its size and a session is only decoded when it
+    is asked for. The journal is replayed at startup and folded into a new
+    snapshot once it passes `journal_max_bytes`, which bounds the replay.
+    """
+    MAGIC = b"SBHSNAP1"
+    ENTRY = struct.Struct("<QQId")
+    FOOTER = struct.Struct("<8sQQ")
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL_SECONDS,
+                 journal_max_bytes: int = SESSION_JOURNAL_MAX_BYTES):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.ttl = ttl
+        self.journal_max_bytes = journal_max_bytes
+        # Serializes journal appends, compaction and reset
+        self._lock = threading.Lock()
+        self._snapshot = self._open_snapshot()
+        self._journaled = self._read_journal()
+        self._journal = open(self.journal_path, "ab")
+
+    @staticmethod
+    def _key(session_id: str) -> int:
+        digest = hashlib.blake2b(session_id.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def _open_snapshot(self) -> Optional[tuple]:
+        """(mmap, index offset, entry count), or None without a usable snapshot."""
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, index_offset, count = self.FOOTER.unpack_from(
+                snapshot, len(snapshot) - self.FOOTER.size)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        if magic != self.MAGIC:
+            logger.error("Ignoring unreadable session snapshot %s", self.path)
+            return None
+        return snapshot, index_offset, count
+
+    def _read_journal(self) -> Dict[str, tuple]:
+        """{session_id: (saved_at, data)} from the journal, last record wins."""
+        journaled = {}
+        try:
+            with open(self.journal_path, "rb+") as f:
+                valid = 0
+                for line in f:
+                    try:
+                        session_id, saved_at, data = json.loads(line)
+                    except ValueError:
+                        break
+                    journaled[session_id] = (saved_at, data)
+                    valid += len(line)
+                # Drop a record torn by a crash so appends start on a new line
+                f.truncate(valid)
+        except FileNotFoundError:
+            pass
+        return journaled
+
+    def _find(self, session_id: str) -> Optional[tuple]:
+        if self._snapshot is None:
+            return None
+        snapshot, index_offset, count = self._snapshot
+        key = self._key(session_id)
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ENTRY.unpack_from(snapshot, index_offset + mid * self.ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        for n in range(lo, count):
+            entry_key, offset, length, _ = self.ENTRY.unpack_from(
+                snapshot, index_offset + n * self.ENTRY.size)
+            if entry_key != key:
+                break
+            record_id, saved_at, data = json.loads(snapshot[offset:offset + length])
+            if record_id == session_id:
+                return saved_at, data
+        return None
+
+    def restore(self, session_id: str) -> Optional[Dict]:
+        """The saved copy of a session, or None if it is unknown, deleted or expired."""
+        saved = self._journaled.get(session_id) or self._find(session_id)
+        if saved is None or saved[1] is None or saved[0] < time.time() - self.ttl:
+            return None
+        return dict(saved[1])
+
+    def append(self, records: List[tuple]):
+        """Journal (session_id, saved_at, data) records; data None marks a deletion."""
+        if not records:
+            return
+        lines = b"".join(
+            json.dumps(record, separators=(",", ":")).encode() + b"\n"
+            for record in records)
+        with self._lock:
+            self._journal.write(lines)
+            self._journal.flush()
+            for session_id, saved_at, data in records:
+                # Saved sessions may be evicted from memory later and then
+                # restored, so the newest copy must hide the snapshot's
+                self._journaled[session_id] = (saved_at, data)
+            if self._journal.tell() > self.journal_max_bytes:
+                self._compact()
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        """Fold the journal into a new snapshot, dropping deleted and expired sessions."""
+        journaled = self._read_journal()
+        journaled_keys = {self._key(session_id) for session_id in journaled}
+        cutoff = time.time() - self.ttl
+        entries = []
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as out:
+            if self._snapshot is not None:
+                snapshot, index_offset, count = self._snapshot
+                for n in range(count):
+                    key, offset, length, saved_at = self.ENTRY.unpack_from(
+                        snapshot, index_offset + n * self.ENTRY.size)
+                    if saved_at < cutoff:
+                        continue
+                    record = snapshot[offset:offset + length]
+                    if key in journaled_keys and json.loads(record)[0] in journaled:
+                        continue
+                    entries.append((key, out.tell(), length, saved_at))
+                    out.write(record)
+            for session_id, (saved_at, data) in journaled.items():
+                if data is None or saved_at < cutoff:
+                    continue
+                record = json.dumps([session_id, saved_at, data],
+                                    separators=(",", ":")).encode()
+                entries.append((self._key(session_id), out.tell(), len(record), saved_at))
+                out.write(record)
+            index_offset = out.tell()
+            entries.sort()
+            for entry in entries:
+                out.write(self.ENTRY.pack(*entry))
+            out.write(self.FOOTER.pack(self.MAGIC, index_offset, len(entries)))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_path, self.path)
+        # Readers may still hold the old map; it is released when unused
+        self._snapshot = self._open_snapshot()
+        self._journaled = {}
+        self._journal.seek(0)
+        self._journal.truncate()
+
+    def reset(self):
+        with self._lock:
+            self._snapshot = None
+            self._journaled = {}
+            self._journal.seek(0)
+            self._journal.truncate()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    Process-local store, split into independently locked shards.
+
+    Reads never create sessions; only writes do. Each shard holds at most
+    its share of `max_sessions`. A write that would add a session to a full
+    shard first expires idle sessions, then evicts the least recently used
+    one if it has been idle for `min_idle` seconds, and otherwise is
+    dropped and counted as rejected, so live conversations are not pushed
+    out by a flood of new session ids.
+
+    With a SessionSnapshot, a background thread saves the sessions changed
+    since the previous save every `save_interval` seconds (and once more at
+    exit), and a session missing from memory is restored from the snapshot
+    the first time it is used.
+    """
+
+    def __init__(self, shard_count: int = SESSION_SHARD_COUNT, ttl: float = SESSION_TTL_SECONDS,
+                 snapshot: SessionSnapshot = None,
+                 save_interval: float = SESSION_SNAPSHOT_INTERVAL_SECONDS,
+                 max_sessions: int = SESSION_MAX_COUNT,
+                 min_idle: float = SESSION_EVICT_MIN_IDLE_SECONDS):
+        self.ttl = ttl
+        self.snapshot = snapshot
+        self.max_sessions = max_sessions
+        self.min_idle = min_idle
+        self._shard_capacity = max(1, -(-max_sessions // shard_count))
+        self._shards = [SessionShard() for _ in range(shard_count)]
+        if snapshot is not None:
+            self._saver = threading.Thread(
+                target=self._run_saver, args=(save_interval,),
+                name="session-snapshot", daemon=True)
+            self._saver.start()
+            atexit.register(self.save, compact=True)
+
+    def _shard(self, session_id: str) -> SessionShard:
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def _admit(self, shard: SessionShard, session_id: str, now: float) -> Optional[SessionRecord]:
+        """A new record for session_id, or None if the shard is full of recent sessions."""
+        if len(shard.sessions) >= self._shard_capacity:
+            shard.expire(now - self.ttl)
+            if (len(shard.sessions) >= self._shard_capacity
+                    and not shard.evict(now - self.min_idle)):
+                shard.rejected += 1
+                return None
+        return shard.add(session_id, now)
+
+    def _session(self, shard: SessionShard, session_id: str, now: float) -> Optional[SessionRecord]:
+        """The session's record, marked as used now, or None if there is none."""
+        record = shard.sessions.get(session_id)
+        if record is not None:
+            record.last_activity = now
+            return record
+        unsaved = shard.unsaved.pop(session_id, None)
+        if unsaved is not None:
+            restored = unsaved.to_dict()
+        # A dirty id missing from memory was deleted or expired since the
+        # last save, so its saved copy is stale
+        elif self.snapshot is None or session_id in shard.dirty:
+            return None
+        else:
+            restored = self.snapshot.restore(session_id)
+        if restored is None:
+            return None
+        record = self._admit(shard, session_id, now)
+        if record is not None:
+            record.update(restored)
+        elif unsaved is not None:
+            shard.unsaved[session_id] = unsaved
+        return record
+
+    def load(self, session_id: str) -> Dict:
+        shard = self._shard(session_id)
+        with shard.lock:
+            record = self._session(shard, session_id, time.monotonic())
+            return record.to_dict() if record is not None else {}
+
+    def get(self, session_id: str, key: str, default=None):
+        shard = self._shard(session_id)
+        with shard.lock:
+            record = self._session(shard, session_id, time.monotonic())
+            return record.get(key, default) if record is not None else default
+
+    def apply(self, session_id: str, changes: Dict, replace: bool = False):
+        shard = self._shard(session_id)
+        with shard.lock:
+            now = time.monotonic()
+            record = self._session(shard, session_id, now)
+            # Clearing a session that does not exist creates nothing
+            if record is None and changes:
+                record = self._admit(shard, session_id, now)
+            if record is not None:
+                if replace:
+                    record.replace(changes)
+                else:
+                    record.update(changes)
+                if self.snapshot is not None:
+                    shard.dirty.add(session_id)
+            shard.expire(now - self.ttl)
+
+    def delete(self, session_id: str):
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.discard(session_id)
+            if self.snapshot is not None:
+                shard.dirty.add(session_id)
+
+    def save(self, compact: bool = False):
+        """Journal every session changed since the last save."""
+        if self.snapshot is None:
+            return
+        records = []
+        for shard in self._shards:
+            with shard.lock:
+                dirty, shard.dirty = shard.dirty, set()
+                wall_offset = time.time() - time.monotonic()
+                for session_id in dirty:
+                    record = shard.sessions.get(session_id) or shard.unsaved.pop(session_id, None)
+                    if record is None:
+                        records.append((session_id, time.time(), None))
+                    else:
+                        records.append((session_id, record.last_activity + wall_offset,
+                                        record.to_dict()))
+        self.snapshot.append(records)
+        if compact:
+            self.snapshot.compact()
+
+    def _run_saver(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.save()
+            except Exception:
+                logger.exception("Saving the session snapshot failed")
+
+    def cleanup(self, ttl: float) -> int:
+        expired = 0
+        for shard in self._shards:
+            with shard.lock:
+                expired += shard.expire(time.monotonic() - ttl)
+        return expired
+
+    def count(self) -> int:
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def stats(self) -> Dict[str, int]:
+        shards = self._shards
+        return {
+            "sessions": sum(len(shard.sessions) for shard in shards),
+            "capacity": self._shard_capacity * len(shards),
+            "expired": sum(shard.expired for shard in shards),
+            "evicted": sum(shard.evicted for shard in shards),
+            "rejected": sum(shard.rejected for shard in shards),
+        }
+
+    def reset(self):
+        self._shards = [SessionShard() for _ in range(len(self._shards))]
+        if self.snapshot is not None:
+            self.snapshot.reset()
+
+
+class SqliteSessionBackend(SessionBackend):
+    """
+    Store shared by every worker process through one SQLite file in WAL mode.
+
+    Each row carries a version that every write replaces with a new random
+    one, so a version never comes back, even after the row was deleted and
+    the session written again. Workers keep a local cache of decoded
+    sessions and only fetch and decode the JSON body when the stored version
+    no longer matches their copy. A batch of changes
+    is written in a single transaction. Only writes refresh `last_activity`;
+    a session not written for `ttl` seconds reads as empty, and every
+    `cleanup_interval` seconds a write also deletes such rows.
+    """
+
+    def __init__(self, path: str, cache_size: int = 10000, ttl: float = SESSION_TTL_SECONDS,
+                 cleanup_interval: float = SESSION_CLEANUP_INTERVAL_SECONDS):
+        self.path = path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._next_cleanup = 0.0
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+            "version INTEGER NOT NULL, last_activity REAL NOT NULL)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_last_activity "
+            "ON sessions (last_activity)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cached(self, session_id: str):
+        with self._cache_lock:
+            return self._cache.get(session_id)
+
+    def _remember(self, session_id: str, version: int, data: Dict):
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+            if len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[session_id] = (version, data)
+
+    def _forget(self, session_id: str):
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+
+    def _read(self, conn, session_id: str):
+        """
+        Returns (version, data) for a session, or (0, {}) if unknown or
+        expired.
+        """
+        cached = self._cached(session_id)
+        row = conn.execute(
+            "SELECT version, CASE WHEN version = ? THEN NULL ELSE data END, last_activity "
+            "FROM sessions WHERE id = ?",
+            (cached[0] if cached else 0, session_id)).fetchone()
+        if row is None:
+            self._forget(session_id)
+            return 0, {}
+        version, body, last_activity = row
+        if last_activity < time.time() - self.ttl:
+            self._forget(session_id)
+            return 0, {}
+        if body is None:
+            return cached
+        data = json.loads(body)
+        self._remember(session_id, version, data)
+        return version, data
+
+    def load(self, session_id: str) -> Dict:
+        return dict(self._read(self._connection(), session_id)[1])
+
+    def _write(self, conn, session_id: str, changes: Dict, replace: bool, now: float):
+        data = {} if replace else self._read(conn, session_id)[1]
+        data = {**data, **changes}
+        # Random and never 0 (unknown); 63 bits fit SQLite's INTEGER
+        version = int.from_bytes(os.urandom(8), "little") >> 1 or 1
+        conn.execute(
+            "INSERT INTO sessions (id, data, version, last_activity) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+            "data = excluded.data, version = excluded.version, "
+            "last_activity = excluded.last_activity",
+            (session_id, json.dumps(data), version, now))
+        self._remember(session_id, version, data)
+
+    def apply(self, session_id: str, changes: Dict, replace: bool = False):
+        self.apply_many({session_id: (changes, replace)})
+
+    def apply_many(self, batch: Dict[str, tuple]):
+        conn = self._connection()
+        now = time.time()
+        # Waits for the database write lock held by other workers
+        with SESSION_LOCK_WAIT.timer("sqlite"):
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            for session_id, (changes, replace) in batch.items():
+                self._write(conn, session_id, changes, replace, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            for session_id in batch:
+                self._forget(session_id)
+            raise
+        if now >= self._next_cleanup:
+            self._next_cleanup = now + self.cleanup_interval
+            self.cleanup(self.ttl)
+
+    def delete(self, session_id: str):
+        self._connection().execute(
+            "DELETE FROM sessions WHERE id = ?", (session_id,))
+        self._forget(session_id)
+
+    def cleanup(self, ttl: float) -> int:
+        cursor = self._connection().execute(
+            "DELETE FROM sessions WHERE last_activity < ?", (time.time() - ttl,))
+        return cursor.rowcount
+
+    def count(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def reset(self):
+        self._connection().execute("DELETE FROM sessions")
+        with self._cache_lock:
+            self._cache.clear()
+
+
+def create_session_backend(name: str = SESSION_BACKEND) -> SessionBackend:
+    if name == "memory":
+        if SESSION_SNAPSHOT_PATH:
+            return MemorySessionBackend(snapshot=SessionSnapshot(SESSION_SNAPSHOT_PATH))
+        return MemorySessionBackend()
+    if name == "sqlite":
+        return SqliteSessionBackend(SESSION_SQLITE_PATH)
+    raise ValueError(f"Unknown session backend: {name}")
+
+
+class SessionTransaction:
+    """
+    Local view of the sessions touched during one webhook turn.
+
+    Each session is loaded from the backend once, on first use. Reads and
+    writes then work on the local copy, and commit() sends all the
+    changes in a single apply_many call.
+    """
+
+    def __init__(self, backend: SessionBackend):
+        self.backend = backend
+        self.views = {}
+        self.writes = {}
+        self.deleted = set()
+
+    def view(self, session_id: str) -> Dict:
+        view = self.views.get(session_id)
+        if view is None:
+            view = self.views[session_id] = self.backend.load(session_id)
+        return view
+
+    def write(self, session_id: str, changes: Dict, replace: bool = False):
+        view = self.view(session_id)
+        if replace or session_id in self.deleted:
+            self.deleted.discard(session_id)
+            view.clear()
+            self.writes[session_id] = ({}, True)
+        view.update(changes)
+        self.writes.setdefault(session_id, ({}, False))[0].update(changes)
+
+    def delete(self, session_id: str):
+        self.views[session_id] = {}
+        self.writes.pop(session_id, None)
+        self.deleted.add(session_id)
+
+    def commit(self):
+        for session_id in self.deleted:
+            self.backend.delete(session_id)
+        if self.writes:
+            self.backend.apply_many(self.writes)
+        self.writes = {}
+        self.deleted = set()
+
+
 class SessionManager:
-    """Enhanced session management with automatic cleanup"""
-    _sessions = defaultdict(dict)
-    _lock = threading.Lock()
-    _last_activity = defaultdict(lambda: datetime.now())
+    """
+    Session management on top of a pluggable SessionBackend.
+
+    Inside `with SessionManager.transaction():` calls on the current thread
+    go through a SessionTransaction and reach the backend once on commit.
+    """
+    ttl = SESSION_TTL_SECONDS
+    backend = create_session_backend()
+    _local = threading.local()
+
+    @classmethod
+    def _current(cls) -> Optional[SessionTransaction]:
+        return getattr(cls._local, "transaction", None)
+
+    @classmethod
+    @contextmanager
+    def transaction(cls):
+        """Batch this thread's session reads and writes until the block exits.
+
+        Changes are committed when the block completes and discarded if it
+        raises. Nested calls join the outer transaction.
+        """
+        current = cls._current()
+        if current is not None:
+            yield current
+            return
+        transaction = SessionTransaction(cls.backend)
+        with cls.bind(transaction):
+            yield transaction
+            transaction.commit()
+
+    @classmethod
+    @contextmanager
+    def bind(cls, transaction: SessionTransaction):
+        """Route this thread's session calls through `transaction` without committing it."""
+        previous = cls._current()
+        cls._local.transaction = transaction
+        try:
+            yield transaction
+        finally:
+            cls._local.transaction = previous
 
     @classmethod
     def get(cls, session_id: str, key: str = None, default=None):
-        with cls._lock:
-            cls._last_activity[session_id] = datetime.now()
-            if key:
-                return cls._sessions[session_id].get(key, default)
-            return cls._sessions[session_id]
+        transaction = cls._current()
+        if transaction is not None:
+            session = transaction.view(session_id)
+            return session.get(key, default) if key else session
+        if key:
+            return cls.backend.get(session_id, key, default)
+        return cls.backend.load(session_id)
 
     @classmethod
     def set(cls, session_id: str, key: str, value: Any):
-        with cls._lock:
-            cls._sessions[session_id][key] = value
-            cls._last_activity[session_id] = datetime.now()
-            cls._cleanup_old_sessions()
+        cls._write(session_id, {key: value})
 
     @classmethod
     def update(cls, session_id: str, data: Dict):
-        with cls._lock:
-            cls._sessions[session_id].update(data)
-            cls._last_activity[session_id] = datetime.now()
+        cls._write(session_id, dict(data))
 
     @classmethod
     def clear(cls, session_id: str):
-        with cls._lock:
-            cls._sessions[session_id] = {}
-            cls._last_activity[session_id] = datetime.now()
+        cls._write(session_id, {}, replace=True)
 
     @classmethod
     def delete(cls, session_id: str):
-        with cls._lock:
-            cls._sessions.pop(session_id, None)
-            cls._last_activity.pop(session_id, None)
+        transaction = cls._current()
+        if transaction is not None:
+            transaction.delete(session_id)
+        else:
+            cls.backend.delete(session_id)
+
+    @classmethod
+    def _write(cls, session_id: str, changes: Dict, replace: bool = False):
+        transaction = cls._current()
+        if transaction is not None:
+            transaction.write(session_id, changes, replace)
+        else:
+            cls.backend.apply(session_id, changes, replace)
+
+    @classmethod
+    def cleanup(cls) -> int:
+        """Expire idle sessions. Returns how many were dropped."""
+        return cls.backend.cleanup(cls.ttl)
+
+    @classmethod
+    def count(cls) -> int:
+        return cls.backend.count()
 
     @classmethod
-    def _cleanup_old_sessions(cls):
-        cutoff = datetime.now() - timedelta(hours=24)
-        expired = [sid for sid, last in cls._last_activity.items()
-                   if last < cutoff]
-        for sid in expired:
-            cls._sessions.pop(sid, None)
-            cls._last_activity.pop(sid, None)
+    def reset(cls):
+        """Drop all sessions."""
+        cls.backend.reset()
+
+    @classmethod
+    def configure(cls, backend: SessionBackend):
+        cls.backend = backend
+
+
+def _session_stats(*names) -> Callable[[], Dict[str, int]]:
+    """Metric callback picking counters from the current backend's stats()."""
+    def collect():
+        stats = SessionManager.backend.stats()
+        if len(names) == 1:
+            return {"": stats[names[0]]} if names[0] in stats else {}
+        return {name: stats[name] for name in names if name in stats}
+    return collect
+
+
+METRICS.extend([
+    CallbackMetric("session_store_sessions", "Sessions held in memory.",
+                   "gauge", _session_stats("sessions")),
+    CallbackMetric("session_store_capacity", "Most sessions the store will hold.",
+                   "gauge", _session_stats("capacity")),
+    CallbackMetric("session_store_removed_total",
+                   "Sessions dropped after their TTL (expired) or to make room (evicted).",
+                   "counter", _session_stats("expired", "evicted"), "reason"),
+    CallbackMetric("session_store_rejected_total",
+                   "New sessions turned away because the store was full of recent ones.",
+                   "counter", _session_stats("rejected")),
+])
+
+# ============================================================================
+# GOOGLE API CLIENTS
+# ============================================================================
+
+
+class GoogleAPIClients:
+    """
+    One service-account login shared by every Google API call in the process.
+
+    The key file is read and the credentials authorized on first use; after
+    that all threads share one AuthorizedSession, whose connection pool keeps
+    TLS connections to Google alive between calls. The access token is
+    renewed under a lock `refresh_margin` seconds before it expires, so
+    requests do not wait on a token exchange mid-call. `adapter` replaces the
+    HTTP transport (any requests transport adapter, e.g. a local fake) and
+    `credentials` the key file.
+    """
+    SCOPES = [
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive',
+        'https://www.googleapis.com/auth/calendar.readonly'
+    ]
+
+    def __init__(self, service_account_file: str = GOOGLE_SERVICE_ACCOUNT_FILE,
+                 credentials=None, adapter: HTTPAdapter = None,
+                 pool_size: int = GOOGLE_HTTP_POOL_SIZE,
+                 refresh_margin: float = GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS):
+        self.service_account_file = service_account_file
+        self.credentials = credentials
+        self.adapter = adapter
+        self.pool_size = pool_size
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._lock = threading.Lock()
+        self._session = None
+        self._token_request = None
+        self._sheets = None
+        self.token_refreshes = 0
+
+    def _mounted(self, session: requests.Session) -> requests.Session:
+        adapter = self.adapter or HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session(self) -> AuthorizedSession:
+        """The shared session, with a token that is good for at least refresh_margin."""
+        with self._lock:
+            if self._session is None:
+                credentials = self.credentials or Credentials.from_service_account_file(
+                    self.service_account_file, scopes=self.SCOPES)
+                self._token_request = Request(self._mounted(requests.Session()))
+                self._session = self._mounted(AuthorizedSession(
+                    credentials, auth_request=self._token_request))
+            credentials = self._session.credentials
+            expiry = credentials.expiry
+            # google-auth keeps expiry as naive UTC
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            if not credentials.valid or (expiry is not None and expiry - now < self.refresh_margin):
+                credentials.refresh(self._token_request)
+                self.token_refreshes += 1
+            return self._session
+
+    def sheets(self) -> gspread.Client:
+        session = self.session()
+        with self._lock:
+            if self._sheets is None:
+                self._sheets = gspread.authorize(session.credentials, session=session)
+            return self._sheets
+
+    def reset(self):
+        """Drop the session and credentials, e.g. after the key file changed."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = self._token_request = self._sheets = None
+
+
+GOOGLE_APIS = GoogleAPIClients()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls: while a call for a key is running, other
+    callers with the same key wait for it and share its result or exception
+    instead of starting their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn: Callable, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# Reads of FAQ spreadsheets, keyed by spreadsheet id
+SHEET_READS = SingleFlight()
 
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
 
 
+class WebhookRequest(dict):
+    """
+    Dialogflow webhook payload, parsed once per turn.
+
+    Still the raw payload dict, with the fields handlers keep asking for
+    pulled out up front and the active output contexts indexed by their
+    short name (the last segment of the context path).
+    """
+
+    def __init__(self, payload: Dict):
+        super().__init__(payload)
+        query_result = self.get("queryResult", {})
+        self.query_text = query_result.get("queryText", "")
+        self.intent_name = query_result.get("intent", {}).get("displayName", "")
+        self.session_path = self.get("session", "")
+        self.session_id = self.session_path.split("/")[-1]
+        self.contexts = {}
+        for context in query_result.get("outputContexts", []):
+            self.contexts.setdefault(
+                context['name'].split('/')[-1], context.get('parameters', {}))
+
+    @property
+    def context_names(self) -> List[str]:
+        return list(self.contexts)
+
+    @classmethod
+    def parse(cls, payload: Dict) -> "WebhookRequest":
+        return payload if isinstance(payload, cls) else cls(payload)
+
+
 def get_context_parameters(req: Dict, context_name: str) -> Dict:
-    contexts = req.get('queryResult', {}).get('outputContexts', [])
-    for context in contexts:
-        if context_name in context['name']:
-            return context.get('parameters', {})
-    return {}
+    return WebhookRequest.parse(req).contexts.get(context_name, {})
 
 
 def extract_session_id(req: Dict) -> str:
@@ -209,66 +1670,1032 @@ def is_similar(a, b, threshold=0.7):
     return SequenceMatcher(None, a, b).ratio() > threshold
 
 
-def load_faq_from_gsheet(sheet_id, worksheet_name):
-    try:
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        creds = Credentials.from_service_account_file(
-            'service_account.json', scopes=scopes)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(sheet_id)
-        worksheet = sheet.worksheet(worksheet_name)
-        rows = worksheet.get_all_records()
-        return rows
-    except Exception as e:
-        logger.error(f"Error loading from worksheet {worksheet_name}: {e}")
+def worksheet_records(values: List[List]) -> List[Dict]:
+    """Rows below the header row as dicts, like Worksheet.get_all_records()."""
+    if not values:
         return []
+    header = values[0]
+    return [dict(zip(header, row + [""] * (len(header) - len(row))))
+            for row in values[1:]]
+
+
+def fetch_faq_worksheets(sheet_id) -> Dict[str, List[Dict]]:
+    """
+    Read every worksheet of a spreadsheet, fetching all their values in
+    one batched request. Returns {worksheet title: rows}. Raises on failure.
+    """
+    return SHEET_READS.do(sheet_id, _fetch_faq_worksheets, sheet_id)
+
+
+def _fetch_faq_worksheets(sheet_id) -> Dict[str, List[Dict]]:
+    sheet = GOOGLE_APIS.sheets().open_by_key(sheet_id)
+    titles = [worksheet.title for worksheet in sheet.worksheets()]
+    ranges = ["'" + title.replace("'", "''") + "'" for title in titles]
+    value_ranges = sheet.values_batch_get(ranges).get("valueRanges", [])
+    return {title: worksheet_records(value_range.get("values", []))
+            for title, value_range in zip(titles, value_ranges)}
+
+
+def _similarity_bound(matches, length):
+    # Same arithmetic as difflib's ratio(), used for its cheap upper bounds
+    return 2.0 * matches / length if length else 1.0
+
+
+class FAQIndex:
+    """
+    FAQ rows compiled once for matching.
+
+    Keywords are normalized with clean_text and answers have their
+    placeholders substituted up front. A query is only scored with
+    SequenceMatcher against keywords whose length and character counts
+    still allow a ratio above the threshold, so the result is the same as
+    checking every keyword in sheet order with is_similar.
+    """
+
+    def __init__(self, faqs: List[Dict], clinic_phone_number: str, threshold: float = 0.7):
+        self.threshold = threshold
+        self.answers = []
+        self._keywords = []
+        self._answer_ids = []
+        self._char_counts = []
+        for faq in faqs:
+            answer = str(faq.get('answer', ''))
+            if "CLINIC_INFO['phone']" in answer:
+                answer = answer.replace(
+                    "CLINIC_INFO['phone']", clinic_phone_number)
+            self.answers.append(answer)
+            for keyword in str(faq.get('question_keywords', '')).split(','):
+                keyword = clean_text(keyword)
+                self._keywords.append(keyword)
+                self._answer_ids.append(len(self.answers) - 1)
+                self._char_counts.append(Counter(keyword))
+        # Keyword ids ordered by length for the length window lookup
+        self._by_length = sorted(range(len(self._keywords)),
+                                 key=lambda i: len(self._keywords[i]))
+        self._lengths = [len(self._keywords[i]) for i in self._by_length]
+
+    def __len__(self):
+        return len(self.answers)
+
+    def candidates(self, query: str) -> List[int]:
+        """Keyword ids, in sheet order, that pass the length and character bounds."""
+        threshold = self.threshold
+        query_len = len(query)
+        # 2 * min(k, q) / (k + q) > threshold bounds the keyword length k
+        lo = bisect_left(self._lengths, int(
+            threshold * query_len / (2 - threshold)))
+        hi = bisect_right(self._lengths, int(
+            query_len * (2 - threshold) / threshold) + 1)
+        query_counts = None
+        ids = []
+        for i in self._by_length[lo:hi]:
+            keyword_len = len(self._keywords[i])
+            total = keyword_len + query_len
+            if _similarity_bound(min(keyword_len, query_len), total) <= threshold:
+                continue
+            if query_counts is None:
+                query_counts = Counter(query)
+            shared = sum(min(n, query_counts[ch])
+                         for ch, n in self._char_counts[i].items())
+            if _similarity_bound(shared, total) <= threshold:
+                continue
+            ids.append(i)
+        ids.sort()
+        return ids
+
+    def match(self, user_input: str) -> Optional[str]:
+        query = clean_text(user_input)
+        matcher = SequenceMatcher(None)
+        matcher.set_seq2(query)
+        for i in self.candidates(query):
+            matcher.set_seq1(self._keywords[i])
+            if matcher.ratio() > self.threshold:
+                return self.answers[self._answer_ids[i]]
+        return None
+
+    def top_k(self, user_input: str, k: int = 3) -> List[tuple]:
+        """Up to k (answer, score) pairs scoring above the threshold, best first."""
+        query = clean_text(user_input)
+        matcher = SequenceMatcher(None)
+        matcher.set_seq2(query)
+        best = {}
+        for i in self.candidates(query):
+            matcher.set_seq1(self._keywords[i])
+            score = matcher.ratio()
+            answer_id = self._answer_ids[i]
+            if score > self.threshold and score > best.get(answer_id, 0.0):
+                best[answer_id] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(self.answers[answer_id], score) for answer_id, score in ranked]
+
+
+class TfidfFAQIndex(FAQIndex):
+    """
+    FAQIndex scoring a query against every keyword in one product.
+
+    Keywords become L2-normalized TF-IDF vectors over the character 2- and
+    3-grams of the space-padded text, stored as a sparse matrix when scipy
+    is installed. A query vector gives the cosine similarity to all keywords
+    in one matrix-vector product; n-grams no keyword has still count
+    towards the query's norm. match() returns the best-scoring answer
+    rather than the first one in sheet order. Requires numpy.
+    """
+    NGRAM_SIZES = (2, 3)
+
+    def __init__(self, faqs: List[Dict], clinic_phone_number: str,
+                 threshold: float = FAQ_TFIDF_THRESHOLD):
+        super().__init__(faqs, clinic_phone_number, threshold)
+        self._vocabulary = {}
+        rows, columns, counts = [], [], []
+        for i, keyword in enumerate(self._keywords):
+            for gram, count in Counter(self._ngrams(keyword)).items():
+                rows.append(i)
+                columns.append(self._vocabulary.setdefault(gram, len(self._vocabulary)))
+                counts.append(count)
+        shape = (len(self._keywords), len(self._vocabulary))
+        rows = np.asarray(rows, dtype=np.intp)
+        columns = np.asarray(columns, dtype=np.intp)
+        document_frequency = np.bincount(columns, minlength=shape[1])
+        self._idf = np.log((1 + shape[0]) / (1 + document_frequency)) + 1.0
+        self._unseen_idf = np.log(1 + shape[0]) + 1.0
+        weights = np.asarray(counts, dtype=np.float64) * self._idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=shape[0]))
+        weights /= norms[rows]
+        if sparse is not None:
+            self._matrix = sparse.csr_matrix((weights, (rows, columns)), shape=shape)
+        else:
+            self._matrix = np.zeros(shape)
+            self._matrix[rows, columns] = weights
+        self._answer_index = np.asarray(self._answer_ids, dtype=np.intp)
+
+    @classmethod
+    def _ngrams(cls, text: str):
+        padded = f" {text} "
+        for n in cls.NGRAM_SIZES:
+            for start in range(len(padded) - n + 1):
+                yield padded[start:start + n]
+
+    def scores(self, query: str) -> "np.ndarray":
+        """Cosine similarity of a cleaned query to every keyword."""
+        vector = np.zeros(len(self._vocabulary))
+        unseen = 0.0
+        for gram, count in Counter(self._ngrams(query)).items():
+            column = self._vocabulary.get(gram)
+            if column is None:
+                unseen += (count * self._unseen_idf) ** 2
+            else:
+                vector[column] = count * self._idf[column]
+        norm = np.sqrt(vector @ vector + unseen)
+        if not norm:
+            return np.zeros(len(self._keywords))
+        return self._matrix @ (vector / norm)
+
+    def top_k(self, user_input: str, k: int = 3) -> List[tuple]:
+        scores = self.scores(clean_text(user_input))
+        best = np.zeros(len(self.answers))
+        np.maximum.at(best, self._answer_index, scores)
+        ranked = np.argsort(-best, kind="stable")[:k]
+        return [(self.answers[answer_id], float(best[answer_id]))
+                for answer_id in ranked if best[answer_id] > self.threshold]
+
+    def match(self, user_input: str) -> Optional[str]:
+        ranked = self.top_k(user_input, 1)
+        return ranked[0][0] if ranked else None
+
+
+def create_faq_index(faqs: List[Dict], clinic_phone_number: str,
+                     matcher: str = FAQ_MATCHER) -> FAQIndex:
+    """FAQ index for the configured matcher; difflib when tfidf lacks numpy."""
+    if matcher == "tfidf":
+        if np is not None:
+            return TfidfFAQIndex(faqs, clinic_phone_number)
+        logger.warning("FAQ_MATCHER=tfidf needs numpy; using difflib matching")
+    elif matcher != "difflib":
+        raise ValueError(f"Unknown FAQ matcher: {matcher}")
+    return FAQIndex(faqs, clinic_phone_number)
 
 
 def match_faq_answer(user_input, faqs, clinic_phone_number):
-    user_input_clean = clean_text(user_input)
-    for faq in faqs:
-        keywords = [clean_text(k) for k in faq['question_keywords'].split(',')]
-        for keyword in keywords:
-            if is_similar(keyword, user_input_clean):
-                answer = faq['answer']
-                if "CLINIC_INFO['phone']" in answer:
-                    answer = answer.replace(
-                        "CLINIC_INFO['phone']", clinic_phone_number)
-                return answer
-    return None
-
-
-def generate_appointment_slots(base_date: datetime = None) -> List[Dict]:
-    """Generate available appointment slots"""
-    if not base_date:
-        base_date = datetime.now()
-
-    slots = []
-    days_ahead = [1, 2, 3, 4, 5, 7, 8]  # Skip today and weekend
-    times = ["9:00 AM", "10:00 AM", "11:00 AM",
-             "2:00 PM", "3:00 PM", "4:00 PM"]
-
-    for days in days_ahead[:6]:  # Show 6 slots
-        date = base_date + timedelta(days=days)
-        if date.weekday() < 5:  # Weekday only
-            time = random.choice(times)
-            slots.append({
-                "date": date.strftime("%A, %B %d"),
-                "time": time,
-                "datetime": date.strftime("%Y-%m-%d")
-            })
+    with FAQ_LOOKUP_LATENCY.timer():
+        if not isinstance(faqs, FAQIndex):
+            faqs = create_faq_index(faqs, clinic_phone_number)
+        return faqs.match(user_input)
+
+
+def generate_appointment_slots(base_date: datetime = None, practitioner_ids: List[str] = None,
+                               count: int = 6) -> List[Dict]:
+    """Next free appointment slots, one per day, for the given practitioners (default: all)"""
+    if practitioner_ids is None:
+        practitioner_ids = list(PRACTITIONERS)
+    return AVAILABILITY.next_free_slots(
+        practitioner_ids, count=count, after=base_date, max_per_day=1)
+
+
+class ConfirmationNumbers:
+    """
+    Unique confirmation numbers like SBH1NWGD10005: a 6-character block
+    prefix, a 3-character sequence number within the block and a check
+    character, in Crockford base32 (no I, L, O or U, so they read back
+    over the phone).
+
+    Each process numbers its confirmations with one itertools.count, which
+    needs no lock. The count is cut into blocks of 32**3 and every block
+    gets a prefix leased through `lease_path` under an exclusive file lock;
+    only the first number of a block touches the file. A lease is the
+    number of seconds since EPOCH, or one more than the last lease in the
+    file if that is later, so workers sharing the file never get the same
+    prefix and a new container, which starts with an empty file, starts
+    past every lease of the containers before it (the file only runs ahead
+    of the clock while more than one block a second is leased). Prefixes
+    repeat after 32**6 seconds, about 34 years. A forked child starts over
+    with leases of its own. Without a usable lease file prefixes are the
+    current second plus a random offset, which is unique within the
+    process only.
+    """
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+    PREFIX = "SBH"
+    PREFIX_WIDTH = 6
+    WIDTH = 3
+    EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+    # Distinct prefixes; a block is at most as long as WIDTH characters count
+    SPACE = len(ALPHABET) ** PREFIX_WIDTH
+    BLOCK = len(ALPHABET) ** WIDTH
+
+    def __init__(self, lease_path: str = CONFIRMATION_LEASE_PATH):
+        self.lease_path = lease_path
+        self._lease_lock = threading.Lock()
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._sequence = itertools.count()
+        self._prefixes = {}
+
+    def next(self) -> str:
+        sequence = next(self._sequence)
+        block, position = divmod(sequence, self.BLOCK)
+        prefix = self._prefixes.get(block) or self._lease(block)
+        body = prefix + self._encode(position, self.WIDTH)
+        return self.PREFIX + body + self.check_character(body)
+
+    def _lease(self, block: int) -> str:
+        with self._lease_lock:
+            if block not in self._prefixes:
+                self._prefixes[block] = self._encode(
+                    self._next_lease() % self.SPACE, self.PREFIX_WIDTH)
+            return self._prefixes[block]
+
+    def _next_lease(self) -> int:
+        now = int(time.time() - self.EPOCH)
+        try:
+            with open(self.lease_path, "a+") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                last = f.read().strip()
+                lease = max(int(last) + 1, now) if last else now
+                f.seek(0)
+                f.truncate()
+                f.write(f"{lease}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            return lease
+        except (OSError, ValueError) as e:
+            logger.warning("Confirmation lease file %s unusable (%s); using a random prefix",
+                           self.lease_path, e)
+            return now + random.randrange(self.SPACE)
+
+    @classmethod
+    def _encode(cls, value: int, width: int) -> str:
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, len(cls.ALPHABET))
+            digits.append(cls.ALPHABET[digit])
+        return "".join(reversed(digits))
+
+    @classmethod
+    def check_character(cls, body: str) -> str:
+        """Luhn mod 32 check character: catches any one wrong character and
+        most swaps of neighbouring characters."""
+        base = len(cls.ALPHABET)
+        total = 0
+        for n, char in enumerate(reversed(body)):
+            value = cls.ALPHABET.index(char) * (2 if n % 2 == 0 else 1)
+            total += value // base + value % base
+        return cls.ALPHABET[-total % base]
+
+    @classmethod
+    def is_valid(cls, confirmation_number: str) -> bool:
+        number = confirmation_number.strip().upper()
+        body = number[len(cls.PREFIX):-1]
+        return (number.startswith(cls.PREFIX)
+                and len(body) == cls.PREFIX_WIDTH + cls.WIDTH
+                and all(char in cls.ALPHABET for char in body)
+                and cls.check_character(body) == number[-1])
+
 
-    return slots
+CONFIRMATION_NUMBERS = ConfirmationNumbers()
 
 
 def generate_confirmation_number() -> str:
     """Generate unique confirmation number"""
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    random_suffix = random.randint(100, 999)
-    return f"SBH{timestamp[-6:]}{random_suffix}"
+    return CONFIRMATION_NUMBERS.next()
+
+
+# ============================================================================
+# FAQ CACHE
+# ============================================================================
+
+
+class FAQSnapshot:
+    """
+    Local copy of the FAQ spreadsheets, {sheet_id: {worksheet: rows}}.
+
+    The file is a header (format magic, saved_at, body length) followed by
+    the JSON body. It is replaced atomically on save, so a reader finds
+    either the previous or the new version, and memory-mapped on load.
+    """
+    MAGIC = b"SBHFAQ01"
+    HEADER = struct.Struct("<8sdQ")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[tuple]:
+        """(saved_at, sheets), or None without a usable snapshot."""
+        try:
+            with open(self.path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as snapshot:
+                magic, saved_at, length = self.HEADER.unpack_from(snapshot)
+                if magic != self.MAGIC:
+                    raise ValueError(f"unknown format {magic!r}")
+                body = snapshot[self.HEADER.size:self.HEADER.size + length]
+            return saved_at, json.loads(body)
+        except FileNotFoundError:
+            return None
+        except (ValueError, struct.error) as e:
+            logger.error("Ignoring unreadable FAQ snapshot %s: %s", self.path, e)
+            return None
+
+    def save(self, sheets: Dict[str, Dict[str, List[Dict]]]):
+        body = json.dumps(sheets, separators=(",", ":")).encode()
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(temporary, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, time.time(), len(body)))
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+
+
+class FAQCache:
+    """
+    In-memory cache of FAQ spreadsheets keyed by sheet_id.
+
+    A refresh reads every worksheet of the spreadsheet in one batched call
+    and compiles each into an FAQ index (see create_faq_index). The new
+    {worksheet: (rows, index)} mapping is only swapped in once all of it is
+    built, so a reader sees either the previous or the new copy of the
+    whole spreadsheet. Reads never touch Google: a spreadsheet seen for the
+    first time is queued for the background refresher and empty worksheets
+    are served until it loads. Entries are re-read every `ttl` seconds; if
+    a refresh fails the last good copy keeps being served and the refresh
+    is retried after `retry`.
+
+    Loads that change a spreadsheet are written to `snapshot`, and
+    load_snapshot() serves that copy at startup while the refresher
+    re-reads the sheet.
+    """
+    ttl = FAQ_CACHE_TTL_SECONDS
+    retry = FAQ_CACHE_RETRY_SECONDS
+    fetcher = staticmethod(fetch_faq_worksheets)
+    snapshot = FAQSnapshot(FAQ_SNAPSHOT_PATH) if FAQ_SNAPSHOT_PATH else None
+
+    _entries = {}
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _refresher = None
+    _missing = ([], create_faq_index([], CLINIC_INFO['phone']))
+    _stats = {
+        "hits": 0,
+        "misses": 0,
+        "refreshes": 0,
+        "refresh_failures": 0,
+        "last_refresh_ms": 0.0,
+        "total_refresh_ms": 0.0
+    }
+
+    @classmethod
+    def get(cls, sheet_id: str, worksheet_name: str) -> List[Dict]:
+        return cls._worksheet(sheet_id, worksheet_name)[0]
+
+    @classmethod
+    def get_index(cls, sheet_id: str, worksheet_name: str) -> "FAQIndex":
+        return cls._worksheet(sheet_id, worksheet_name)[1]
+
+    @classmethod
+    def _new_entry(cls) -> Dict:
+        return {
+            "worksheets": MappingProxyType({}),
+            "loaded_at": None,
+            "next_refresh": 0.0
+        }
+
+    @classmethod
+    def _worksheet(cls, sheet_id: str, worksheet_name: str) -> tuple:
+        return cls._lookup(sheet_id)["worksheets"].get(worksheet_name, cls._missing)
+
+    @classmethod
+    def _lookup(cls, sheet_id: str) -> Dict:
+        with cls._lock:
+            entry = cls._entries.get(sheet_id)
+            if entry is None:
+                entry = cls._new_entry()
+                cls._entries[sheet_id] = entry
+            if entry["loaded_at"] is None:
+                cls._stats["misses"] += 1
+                miss = True
+            else:
+                cls._stats["hits"] += 1
+                miss = False
+            snapshot = dict(entry)
+        cls._ensure_refresher()
+        if miss:
+            cls._wakeup.set()
+        return snapshot
+
+    @classmethod
+    def refresh(cls, sheet_id: str) -> bool:
+        """Synchronously re-read every worksheet of a spreadsheet. Returns True on success."""
+        started = time.perf_counter()
+        try:
+            rows_by_name = cls.fetcher(sheet_id)
+            worksheets = cls._build(rows_by_name)
+            ok = True
+        except Exception as e:
+            logger.error("FAQ refresh failed for %s: %s", sheet_id, e)
+            ok = False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.setdefault(sheet_id, cls._new_entry())
+            cls._stats["last_refresh_ms"] = elapsed_ms
+            cls._stats["total_refresh_ms"] += elapsed_ms
+            if ok:
+                changed = {name: rows for name, (rows, _) in entry["worksheets"].items()} != rows_by_name
+                entry["worksheets"] = worksheets
+                entry["loaded_at"] = now
+                entry["next_refresh"] = now + cls.ttl
+                cls._stats["refreshes"] += 1
+            else:
+                entry["next_refresh"] = now + cls.retry
+                cls._stats["refresh_failures"] += 1
+        if ok and changed:
+            cls.save_snapshot()
+        return ok
+
+    @classmethod
+    def _build(cls, rows_by_name: Dict[str, List[Dict]]) -> MappingProxyType:
+        return MappingProxyType({
+            name: (rows, create_faq_index(rows, CLINIC_INFO['phone']))
+            for name, rows in rows_by_name.items()
+        })
+
+    @classmethod
+    def save_snapshot(cls):
+        if cls.snapshot is None:
+            return
+        with cls._lock:
+            sheets = {
+                sheet_id: {name: rows for name, (rows, _) in entry["worksheets"].items()}
+                for sheet_id, entry in cls._entries.items()
+                if entry["loaded_at"] is not None
+            }
+        try:
+            cls.snapshot.save(sheets)
+        except OSError as e:
+            logger.error("Saving the FAQ snapshot failed: %s", e)
+
+    @classmethod
+    def load_snapshot(cls) -> bool:
+        """
+        Serve the saved spreadsheets until the refresher has re-read them.
+        Returns True if a snapshot was loaded.
+        """
+        loaded = cls.snapshot.load() if cls.snapshot is not None else None
+        if loaded is None:
+            return False
+        saved_at, sheets = loaded
+        built = {sheet_id: cls._build(rows_by_name) for sheet_id, rows_by_name in sheets.items()}
+        now = time.monotonic()
+        with cls._lock:
+            for sheet_id, worksheets in built.items():
+                entry = cls._entries.setdefault(sheet_id, cls._new_entry())
+                if entry["loaded_at"] is None:
+                    entry["worksheets"] = worksheets
+                    entry["loaded_at"] = now
+                    # Due now: the first lookup starts the refresher
+                    entry["next_refresh"] = 0.0
+        logger.info("Loaded FAQ snapshot of %d sheet(s) saved at %s",
+                    len(sheets), datetime.fromtimestamp(saved_at).isoformat(timespec="seconds"))
+        return True
+
+    @classmethod
+    def stats(cls) -> Dict:
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats["entries"] = len(cls._entries)
+            stats["worksheets"] = sum(
+                len(entry["worksheets"]) for entry in cls._entries.values())
+        return stats
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            for name in cls._stats:
+                cls._stats[name] = 0 if isinstance(cls._stats[name], int) else 0.0
+
+    @classmethod
+    def _ensure_refresher(cls):
+        if cls._refresher is not None and cls._refresher.is_alive():
+            return
+        with cls._lock:
+            if cls._refresher is None or not cls._refresher.is_alive():
+                cls._refresher = threading.Thread(
+                    target=cls._run, name="faq-cache-refresher", daemon=True)
+                cls._refresher.start()
+
+    @classmethod
+    def _run(cls):
+        while True:
+            with cls._lock:
+                now = time.monotonic()
+                due = [sheet_id for sheet_id, entry in cls._entries.items()
+                       if entry["next_refresh"] <= now]
+                upcoming = [entry["next_refresh"] for entry in cls._entries.values()
+                            if entry["next_refresh"] > now]
+            for sheet_id in due:
+                cls.refresh(sheet_id)
+            if due:
+                continue
+            timeout = min(upcoming) - now if upcoming else None
+            cls._wakeup.wait(timeout)
+            cls._wakeup.clear()
+
+
+FAQCache.load_snapshot()
+
+
+# ============================================================================
+# AVAILABILITY
+# ============================================================================
+
+
+WEEKDAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def parse_clinic_hours(hours: str) -> tuple:
+    """
+    (open weekdays, opening time, closing time) from text like
+    "Monday-Friday 9:00 AM - 5:00 PM EST", weekdays numbered as in
+    date.weekday(). Raises ValueError if the text is not in that form.
+    """
+    match = re.match(r"\s*([a-z]+)(?:\s*-\s*([a-z]+))?\s+"
+                     r"(\d{1,2}:\d{2}\s*[ap]m)\s*-\s*(\d{1,2}:\d{2}\s*[ap]m)",
+                     hours.lower())
+    if not match or match.group(1) not in WEEKDAY_NAMES \
+            or match.group(2) not in WEEKDAY_NAMES + (None,):
+        raise ValueError(f"Unrecognized clinic hours: {hours!r}")
+    first = WEEKDAY_NAMES.index(match.group(1))
+    last = WEEKDAY_NAMES.index(match.group(2) or match.group(1))
+    days = frozenset((first + n) % 7 for n in range((last - first) % 7 + 1))
+    opens, closes = (datetime.strptime(value.replace(" ", ""), "%I:%M%p").time()
+                     for value in match.group(3, 4))
+    return days, opens, closes
+
+
+CLINIC_OPEN_DAYS, CLINIC_OPENS, CLINIC_CLOSES = parse_clinic_hours(CLINIC_INFO["hours"])
+
+
+def clinic_closes_at(day) -> datetime:
+    return datetime.combine(day, CLINIC_CLOSES, tzinfo=CLINIC_TZ)
+
+
+@functools.lru_cache(maxsize=256)
+def appointment_grid(day) -> tuple:
+    """
+    (start, slot fields) for each appointment time on a day the clinic is
+    open, with the display strings formatted once per date.
+    """
+    if day.weekday() not in CLINIC_OPEN_DAYS:
+        return ()
+    length = timedelta(minutes=APPOINTMENT_SLOT_MINUTES)
+    date_text = datetime(day.year, day.month, day.day).strftime("%A, %B %d")
+    grid = []
+    for hour in APPOINTMENT_HOURS:
+        start = datetime(day.year, day.month, day.day, hour, tzinfo=CLINIC_TZ)
+        if start.time() < CLINIC_OPENS or start + length > clinic_closes_at(day):
+            continue
+        grid.append((start, {
+            "date": date_text,
+            "time": start.strftime("%I:%M %p").lstrip("0"),
+            "datetime": day.isoformat(),
+            "start": start.isoformat()
+        }))
+    return tuple(grid)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ISO-8601 timestamp as an aware datetime (naive values are clinic time)."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=CLINIC_TZ)
+    return parsed
+
+
+class BusyIntervalSource:
+    """Where practitioners' busy time comes from, keyed by calendar_id"""
+
+    def busy_intervals(self, calendar_id: str, start: datetime, end: datetime) -> List[tuple]:
+        """Busy (start, end) pairs of aware datetimes overlapping [start, end)."""
+        raise NotImplementedError
+
+
+class FileBusySource(BusyIntervalSource):
+    """
+    Busy intervals read from a local JSON file of the form
+    {"<calendar_id>": [["<start>", "<end>"], ...]} with ISO-8601 times.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def busy_intervals(self, calendar_id: str, start: datetime, end: datetime) -> List[tuple]:
+        with open(self.path) as f:
+            calendars = json.load(f)
+        intervals = []
+        for busy_start, busy_end in calendars.get(calendar_id, []):
+            busy_start = parse_timestamp(busy_start)
+            busy_end = parse_timestamp(busy_end)
+            if busy_start < end and busy_end > start:
+                intervals.append((busy_start, busy_end))
+        return intervals
+
+
+class GoogleCalendarBusySource(BusyIntervalSource):
+    """Busy intervals from the Google Calendar freeBusy API"""
+    FREEBUSY_URL = "https://www.googleapis.com/calendar/v3/freeBusy"
+
+    def __init__(self, clients: GoogleAPIClients = None):
+        self.clients = clients or GOOGLE_APIS
+
+    def busy_intervals(self, calendar_id: str, start: datetime, end: datetime) -> List[tuple]:
+        response = self.clients.session().post(
+            self.FREEBUSY_URL,
+            json={
+                "timeMin": start.isoformat(),
+                "timeMax": end.isoformat(),
+                "items": [{"id": calendar_id}]
+            },
+            timeout=10
+        )
+        response.raise_for_status()
+        calendar = response.json().get("calendars", {}).get(calendar_id, {})
+        if calendar.get("errors"):
+            raise RuntimeError(f"freeBusy errors: {calendar['errors']}")
+        return [(parse_timestamp(busy["start"]), parse_timestamp(busy["end"]))
+                for busy in calendar.get("busy", [])]
+
+
+def create_busy_source(name: str = AVAILABILITY_SOURCE) -> BusyIntervalSource:
+    if name == "google":
+        return GoogleCalendarBusySource()
+    if name == "file":
+        return FileBusySource(AVAILABILITY_FILE)
+    raise ValueError(f"Unknown availability source: {name}")
+
+
+class BusyIndex:
+    """
+    Busy intervals of one calendar, merged into sorted non-overlapping runs.
+
+    Because the runs never overlap, the only run that can collide with a
+    slot is the last one starting before the slot ends, found by bisect.
+    """
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals: List[tuple]):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        i = bisect_left(self.starts, end) - 1
+        return i < 0 or self.ends[i] <= start
+
+
+class AvailabilityEngine:
+    """
+    Free appointment slots computed from practitioners' calendars.
+
+    Candidate slots are the clinic's appointment times on the days it is
+    open, starting tomorrow. Each practitioner's busy time is loaded from
+    `source` by calendar_id into a BusyIndex that is reused for `ttl`
+    seconds, and query results are cached for the same time. If a calendar
+    cannot be loaded the last copy is kept; without one the practitioner
+    is offered no slots, and the load is retried after `retry` seconds.
+
+    A practitioner's free slots on a date are worked out once per BusyIndex
+    and kept as finished slot dicts, shared by every query and session that
+    offers them, so callers must not modify them. A date is dropped from
+    the cache when the clinic closes on it.
+    """
+
+    def __init__(self, source: BusyIntervalSource, practitioners: Dict = PRACTITIONERS,
+                 ttl: float = AVAILABILITY_CACHE_TTL_SECONDS,
+                 horizon_days: int = AVAILABILITY_HORIZON_DAYS,
+                 retry: float = AVAILABILITY_RETRY_SECONDS):
+        self.source = source
+        self.practitioners = practitioners
+        self.ttl = ttl
+        self.retry = retry
+        self._loads = SingleFlight()
+        self._refreshing = set()
+        self.horizon = timedelta(days=horizon_days)
+        self._indexes = {}
+        self._results = {}
+        self._day_slots = {}
+        self._next_day_expiry = None
+        self._lock = threading.Lock()
+
+    def busy_index(self, practitioner_id: str, now: datetime, force: bool = False) -> Optional[BusyIndex]:
+        """The practitioner's busy time, or None if it has never loaded."""
+        calendar_id = self.practitioners[practitioner_id]["calendar_id"]
+        with self._lock:
+            cached = self._indexes.get(calendar_id)
+        if not force and cached is not None and time.monotonic() < cached[0]:
+            return cached[1]
+        # Callers that find the calendar stale together share one load
+        return self._loads.do(calendar_id, self._load, practitioner_id, calendar_id, now, cached)
+
+    def _load(self, practitioner_id: str, calendar_id: str, now: datetime,
+              cached: Optional[tuple]) -> Optional[BusyIndex]:
+        try:
+            index = BusyIndex(self.source.busy_intervals(
+                calendar_id, now, now + self.horizon))
+            expires = time.monotonic() + self.ttl
+            loaded = True
+        except Exception as e:
+            logger.error(
+                "Error loading availability for %s: %s", practitioner_id, e)
+            # Serve the last known calendar if there is one; never guess
+            # that an unknown calendar is free
+            index = cached[1] if cached is not None else None
+            expires = time.monotonic() + self.retry
+            loaded = False
+        with self._lock:
+            self._indexes[calendar_id] = (expires, index, loaded)
+        return index
+
+    def candidate_days(self, now: datetime):
+        """Days the clinic is open, from tomorrow up to the horizon."""
+        day = now.date() + timedelta(days=1)
+        last_day = (now + self.horizon).date()
+        while day <= last_day:
+            if day.weekday() in CLINIC_OPEN_DAYS:
+                yield day
+            day += timedelta(days=1)
+
+    def day_slots(self, practitioner_id: str, index: BusyIndex, day) -> Dict[int, Dict]:
+        """{position in appointment_grid(day): slot} for the practitioner's free times."""
+        key = (practitioner_id, day)
+        with self._lock:
+            cached = self._day_slots.get(key)
+        if cached is not None and cached[0] is index:
+            return cached[1]
+        length = timedelta(minutes=APPOINTMENT_SLOT_MINUTES)
+        slots = {}
+        for position, (start, fields) in enumerate(appointment_grid(day)):
+            if index.is_free(start, start + length):
+                slots[position] = dict(fields, practitioner_id=practitioner_id)
+        with self._lock:
+            self._day_slots[key] = (index, slots)
+        return slots
+
+    def _expire_days(self, now: datetime):
+        with self._lock:
+            if self._next_day_expiry is not None and now < self._next_day_expiry:
+                return
+            for key in [key for key in self._day_slots if clinic_closes_at(key[1]) <= now]:
+                del self._day_slots[key]
+            closes = clinic_closes_at(now.date())
+            self._next_day_expiry = closes if now < closes else \
+                clinic_closes_at(now.date() + timedelta(days=1))
+
+    def next_free_slots(self, practitioner_ids: List[str], count: int = 4,
+                        after: datetime = None, max_per_day: int = None) -> List[Dict]:
+        """
+        The next `count` slots where at least one of the practitioners is free.
+        Each slot names the first listed practitioner who is free then.
+        The slot dicts are shared; see the class docstring.
+        """
+        key = (tuple(practitioner_ids), count, max_per_day)
+        if after is None:
+            with self._lock:
+                cached = self._results.get(key)
+            if cached is not None and time.monotonic() < cached[0]:
+                return list(cached[1])
+            now = datetime.now(CLINIC_TZ)
+        else:
+            now = after if after.tzinfo else after.replace(tzinfo=CLINIC_TZ)
+        self._expire_days(datetime.now(CLINIC_TZ))
+
+        indexes = [(practitioner_id, self.busy_index(practitioner_id, now))
+                   for practitioner_id in practitioner_ids]
+        complete = all(index is not None for _, index in indexes)
+        indexes = [(practitioner_id, index) for practitioner_id, index in indexes
+                   if index is not None]
+        slots = []
+        for day in self.candidate_days(now):
+            if len(slots) >= count:
+                break
+            free = [self.day_slots(practitioner_id, index, day)
+                    for practitioner_id, index in indexes]
+            taken = 0
+            for position in range(len(appointment_grid(day))):
+                if len(slots) >= count or (max_per_day and taken >= max_per_day):
+                    break
+                for day_slots in free:
+                    slot = day_slots.get(position)
+                    if slot is not None:
+                        slots.append(slot)
+                        taken += 1
+                        break
+
+        if after is None and complete:
+            with self._lock:
+                self._results[key] = (time.monotonic() + self.ttl, tuple(slots))
+        return slots
+
+    def refresh_ahead(self, executor, within: float):
+        """
+        Reload on `executor` the calendars that are missing or expire within
+        `within` seconds, unless a reload is already running, so requests
+        keep finding them fresh. A calendar whose last load failed is only
+        retried once its `retry` delay is over.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = []
+            for practitioner_id, practitioner in self.practitioners.items():
+                if practitioner_id in self._refreshing:
+                    continue
+                cached = self._indexes.get(practitioner["calendar_id"])
+                # Only a loaded calendar is worth reloading early
+                if cached is None or cached[0] <= (now + within if cached[2] else now):
+                    due.append(practitioner_id)
+            self._refreshing.update(due)
+        for practitioner_id in due:
+            executor.submit(self._refresh, practitioner_id)
+
+    def _refresh(self, practitioner_id: str):
+        try:
+            self.busy_index(practitioner_id, datetime.now(CLINIC_TZ), force=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(practitioner_id)
+
+    def warm(self, practitioner_ids: List[str] = None):
+        """Load busy time for the given practitioners (default: all) ahead of use."""
+        now = datetime.now(CLINIC_TZ)
+        for practitioner_id in practitioner_ids or list(self.practitioners):
+            self.busy_index(practitioner_id, now)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self._results.clear()
+            self._day_slots.clear()
+            self._next_day_expiry = None
+
+
+AVAILABILITY = AvailabilityEngine(create_busy_source())
+
+# ============================================================================
+# SERIALIZATION
+# ============================================================================
+
+
+class StdlibJSONCodec:
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+
+def create_json_codec(name: str = JSON_CODEC_NAME):
+    """orjson when it is installed (or asked for), the standard library otherwise"""
+    if name == "json" or (name == "auto" and orjson is None):
+        return StdlibJSONCodec()
+    if orjson is None:
+        raise ValueError("JSON_CODEC=orjson but orjson is not installed")
+    return OrjsonCodec()
+
+
+JSON_CODEC = create_json_codec()
+
+
+class EncodedJSON(dict):
+    """
+    A JSON object that also carries its serialized bytes.
+
+    Readers see an ordinary dict; dumps_response splices `encoded` into the
+    output instead of serializing the object again. Instances are shared
+    between responses, so they must not be mutated.
+    """
+    __slots__ = ("encoded",)
+
+    def __init__(self, obj: Dict):
+        super().__init__(obj)
+        self.encoded = JSON_CODEC.dumps(obj)
+
+
+def _dumps_value(value) -> bytes:
+    if isinstance(value, EncodedJSON):
+        return value.encoded
+    if isinstance(value, list) and any(isinstance(item, EncodedJSON) for item in value):
+        return b"[" + b",".join(_dumps_value(item) for item in value) + b"]"
+    return JSON_CODEC.dumps(value)
+
+
+def dumps_response(response: Dict) -> bytes:
+    """Serialize a webhook response, reusing pre-encoded parts (one level deep)."""
+    if isinstance(response, EncodedJSON):
+        return response.encoded
+    return b"{" + b",".join(
+        JSON_CODEC.dumps(key) + b":" + _dumps_value(value)
+        for key, value in response.items()
+    ) + b"}"
+
+
+def json_response(payload: Dict, status: int = 200) -> Response:
+    with SERIALIZATION_LATENCY.timer("encode"):
+        body = dumps_response(payload)
+    return Response(body, status=status, mimetype="application/json")
+
+
+@functools.lru_cache(maxsize=256)
+def _chips_message(suggestions: tuple) -> EncodedJSON:
+    return EncodedJSON({
+        "payload": {
+            "richContent": [[{
+                "type": "chips",
+                "options": [{"text": s} for s in suggestions]
+            }]]
+        }
+    })
+
+
+@functools.lru_cache(maxsize=256)
+def _cards_message(cards: tuple) -> EncodedJSON:
+    card_content = []
+    for title, subtitle, action_link in cards:
+        card_item = {
+            "type": "info",
+            "title": title,
+            "subtitle": subtitle
+        }
+        if action_link is not None:
+            card_item["actionLink"] = action_link
+        card_content.append(card_item)
+    return EncodedJSON({
+        "payload": {"richContent": [card_content]}
+    })
 
 
 # ============================================================================
@@ -288,28 +2715,19 @@ def build_response(
         ]
     }
     if suggestions:
-        response["fulfillmentMessages"].append({
-            "payload": {
-                "richContent": [[{
-                    "type": "chips",
-                    "options": [{"text": s} for s in suggestions]
-                }]]
-            }
-        })
+        response["fulfillmentMessages"].append(
+            _chips_message(tuple(suggestions)))
     if cards:
-        card_content = []
-        for card in cards:
-            card_item = {
-                "type": "info",
-                "title": card.get("title", ""),
-                "subtitle": card.get("subtitle", "")
-            }
-            if "actionLink" in card:
-                card_item["actionLink"] = card["actionLink"]
-            card_content.append(card_item)
-        response["fulfillmentMessages"].append({
-            "payload": {"richContent": [card_content]}
-        })
+        card_key = tuple(
+            (card.get("title", ""), card.get("subtitle", ""), card.get("actionLink"))
+            for card in cards
+        )
+        try:
+            message = _cards_message(card_key)
+        except TypeError:
+            # An unhashable actionLink; build the message without caching it
+            message = _cards_message.__wrapped__(card_key)
+        response["fulfillmentMessages"].append(message)
     if output_contexts:
         response["outputContexts"] = output_contexts
     return response
@@ -326,35 +2744,73 @@ def create_context(session_path: str, name: str, lifespan: int = 5, parameters:
 
 
 def intent_handler_wrapper(handler):
+    @functools.wraps(handler)
     def wrapped(session_id, req):
         user_input = req.get('queryResult', {}).get('queryText', '')
         return handler(session_id, req, user_input)
     return wrapped
 
 
+def static_response(
+    text: str,
+    suggestions: List[str] = None,
+    cards: List[Dict] = None
+) -> EncodedJSON:
+    """
+    build_response for content that is fixed at startup, encoded once.
+
+    The result is shared by every request that returns it, so handlers must
+    hand it back as is rather than adding contexts to it.
+    """
+    return EncodedJSON(build_response(text, suggestions, cards=cards))
+
+
+def faq_response(req: Dict, area: str, suggestions: List[str],
+                 menu_labels: tuple = ()) -> Optional[Dict]:
+    """
+    build_response with the answer from the area's FAQ worksheet, or None
+    when nothing matches. Queries that are just the area's menu label
+    (e.g. the "💰 Billing" chip) are left to the caller's menu response.
+    """
+    user_input = req.get("queryResult", {}).get("queryText", "")
+    if re.sub(r"[^a-z ]", "", clean_text(user_input)).strip() in menu_labels:
+        return None
+    faqs = FAQCache.get_index(SHEET_ID, FAQ_WORKSHEETS[area])
+    answer = match_faq_answer(user_input, faqs, CLINIC_INFO['phone'])
+    return build_response(answer, suggestions) if answer else None
+
+
+def greeting_for_hour(hour: int) -> str:
+    return "Good morning" if hour < 12 else "Good afternoon" if hour < 18 else "Good evening"
+
+
 # ============================================================================
 # MAIN HANDLER FUNCTIONS
 # ============================================================================
 
-def welcome_handler(session_id: str, req: Dict) -> Dict:
-    SessionManager.clear(session_id)
-    hour = datetime.now().hour
-    greeting = "Good morning" if hour < 12 else "Good afternoon" if hour < 18 else "Good evening"
-    text = (
+# One pre-encoded welcome per greeting; the hour only picks which to send
+WELCOME_RESPONSES = {
+    greeting: static_response(
         f"👋 {greeting}! Welcome to {CLINIC_INFO['name']}!\n\n"
         f"{CLINIC_INFO['emergency_text']}\n\n"
         "I'm Rianna, your SolreiClinicAI assistant. I'm here to help you with appointments, "
-        "prescriptions, insurance, and more. What can I help you with today?"
+        "prescriptions, insurance, and more. What can I help you with today?",
+        [
+            "📅 Schedule Appointment",
+            "💊 Prescriptions",
+            "🏥 Insurance",
+            "💰 Billing",
+            "📞 Contact Provider",
+            "ℹ️ General Information"
+        ]
     )
-    suggestions = [
-        "📅 Schedule Appointment",
-        "💊 Prescriptions",
-        "🏥 Insurance",
-        "💰 Billing",
-        "📞 Contact Provider",
-        "ℹ️ General Information"
-    ]
-    return build_response(text, suggestions)
+    for greeting in ("Good morning", "Good afternoon", "Good evening")
+}
+
+
+def welcome_handler(session_id: str, req: Dict) -> Dict:
+    SessionManager.clear(session_id)
+    return WELCOME_RESPONSES[greeting_for_hour(datetime.now().hour)]
 
 # ============================================================================
 # APPOINTMENT HANDLERS
@@ -557,10 +3013,8 @@ def get_practitioners_in_state(state_abbr: str) -> list:
     """
     Returns a list of practitioners licensed in the given state abbreviation.
     """
-    return [
-        practitioner for practitioner in PRACTITIONERS.values()
-        if state_abbr in practitioner.get("states", [])
-    ]
+    return [PRACTITIONERS[practitioner_id]
+            for practitioner_id in PROVIDER_DIRECTORY.find(state=state_abbr)]
 
 
 def collect_new_patient_state_handler(session_id: str, req: Dict) -> Dict:
@@ -577,10 +3031,9 @@ def collect_new_patient_state_handler(session_id: str, req: Dict) -> Dict:
         last_name = SessionManager.get(session_id, "last_name", "")
         patient_name = f"{first_name} {last_name}".strip()
 
-    # Normalize state input
-    state_key = state_input.lower().strip()
-    # Try to get both full state name and abbreviation
-    state_abbr = LICENSED_STATES.get(state_key, state_key.upper())
+    # Accept both full state name and abbreviation
+    state_abbr = PROVIDER_DIRECTORY.state_abbreviation(
+        state_input) or state_input.upper()
     practitioners_available = get_practitioners_in_state(state_abbr)
 
     if practitioners_available:
@@ -875,13 +3328,27 @@ def collect_phone_consultation_handler(session_id: str, req: Dict) -> Dict:
 # -----------------------
 
 
+def no_appointment_slots_response(first_name: str) -> Dict:
+    """Shown when no practitioner has an open slot within the booking horizon"""
+    return build_response(
+        f"I'm sorry, {first_name}, I couldn't find any open appointment times right now. "
+        f"Please call our office at {CLINIC_INFO['phone']} and we'll find a time that works for you.",
+        suggestions=["Call Office", "Return to Main Menu"]
+    )
+
+
 def initial_assessment_handler(session_id: str, req: Dict) -> Dict:
     """Handle initial assessment scheduling"""
     patient_name = SessionManager.get(session_id, "patient_name", "")
     first_name = patient_name.split()[0] if patient_name else "there"
 
-    # Generate appointment slots
-    slots = generate_appointment_slots()
+    # Offer slots of practitioners licensed in the patient's state
+    patient_state = SessionManager.get(session_id, "patient_state", "")
+    practitioner_ids = PROVIDER_DIRECTORY.find(
+        state=patient_state) if patient_state else None
+    slots = generate_appointment_slots(practitioner_ids=practitioner_ids)
+    if not slots:
+        return no_appointment_slots_response(first_name)
 
     # Format slots for display as a bulleted list
     slot_text = ""
@@ -949,6 +3416,9 @@ def select_assessment_appointment_slot_handler(session_id: str, req: Dict) -> Di
     # Store appointment details (NO CHANGE)
     SessionManager.set(session_id, "appointment_date", selected_slot['date'])
     SessionManager.set(session_id, "appointment_time", selected_slot['time'])
+    if selected_slot.get('practitioner_id'):
+        SessionManager.set(session_id, "practitioner_id",
+                           selected_slot['practitioner_id'])
 
     # Build confirmation message (NO CHANGE)
     first_name = patient_name.split()[0] if patient_name else "there"
@@ -1079,12 +3549,7 @@ def collect_assessment_phone_final_handler(session_id: str, req: Dict) -> Dict:
 def appointment_complete_response_handler(session_id, req, user_input):
     """Handles appointment_complete_response intent with user input."""
     try:
-        contexts = req.get("queryResult", {}).get("outputContexts", [])
-        params = {}
-        for context in contexts:
-            if "appointment_complete_response" in context.get("name", ""):
-                params = context.get("parameters", {})
-                break
+        params = get_context_parameters(req, "appointment_complete_response")
 
         patient_name = params.get('patient_name', 'there')
         appointment_date = params.get('appointment_date', '')
@@ -1261,7 +3726,10 @@ def collect_existing_patient_practitioner_handler(session_id: str, req: Dict) ->
     # Store practitioner info
     SessionManager.set(session_id, "practitioner_id", matched_practitioner)
     practitioner = PRACTITIONERS[matched_practitioner]
-    slots = generate_appointment_slots()
+    slots = generate_appointment_slots(
+        practitioner_ids=[matched_practitioner], count=4)
+    if not slots:
+        return no_appointment_slots_response(first_name or "there")
     SessionManager.set(session_id, "appointment_slots", slots)
     slot_text = ""
     for i, slot in enumerate(slots[:4], 1):
@@ -1342,15 +3810,17 @@ def select_existing_appointment_slot_handler(session_id: str, req: Dict) -> Dict
     )
 
 
+CANCELLATION_RESPONSE = static_response(
+    "We're sorry to hear you'd like to cancel your appointment. "
+    "To proceed, please call our office at "
+    f"{CLINIC_INFO['phone']} or reply here with your reason for cancellation.",
+    ["Call Office", "Reschedule", "No longer need appointment"]
+)
+
+
 def cancellation_request_handler(session_id: str, req: Dict) -> Dict:
     """Handles appointment cancellation requests."""
-    text = (
-        "We're sorry to hear you'd like to cancel your appointment. "
-        "To proceed, please call our office at "
-        f"{CLINIC_INFO['phone']} or reply here with your reason for cancellation."
-    )
-    suggestions = ["Call Office", "Reschedule", "No longer need appointment"]
-    return build_response(text, suggestions)
+    return CANCELLATION_RESPONSE
 
 
 def collect_existing_phone_final_handler(session_id: str, req: Dict) -> Dict:
@@ -1436,11 +3906,6 @@ def collect_existing_phone_final_handler(session_id: str, req: Dict) -> Dict:
 def prescription_entry_handler(session_id: str, req: Dict) -> Dict:
     user_input = req.get("queryResult", {}).get(
         "queryText", "").strip().lower()
-    contexts = req.get("queryResult", {}).get("outputContexts", [])
-    context_names = [c['name'].split('/')[-1] for c in contexts]
-    clinic_phone_number = CLINIC_INFO.get('phone', "407-638-8903")
-    faqs = load_faq_from_gsheet(SHEET_ID, "prescription_faq")
-    answer = match_faq_answer(user_input, faqs, clinic_phone_number)
 
     if user_input in ["prescription", "💊 prescription", "prescriptions", "💊 prescriptions"]:
         return build_response(
@@ -1451,6 +3916,10 @@ def prescription_entry_handler(session_id: str, req: Dict) -> Dict:
         )
 
     # [Continue your original prescription flow, but ensure that every path leads to a guiding question, suggestions, or an option to escalate to a human.]
+    answer = faq_response(req, "prescription", ["Refill Request", "Prescription Question", "Return to Main Menu"],
+                          ("prescription", "prescriptions"))
+    if answer:
+        return answer
 
     # Fallback for prescription handler
     return build_response(
@@ -1466,60 +3935,81 @@ def prescription_entry_handler(session_id: str, req: Dict) -> Dict:
 # ============================================================================
 
 
+INSURANCE_SUGGESTIONS = ["Verify Coverage", "File Claim", "Get Superbill", "Check Benefits"]
+INSURANCE_ENTRY_RESPONSE = static_response(
+    f"We accept: {', '.join(INSURANCE_ACCEPTED[:5])}, and more\n\n"
+    "How can I help with insurance today?",
+    INSURANCE_SUGGESTIONS
+)
+
+
 def insurance_entry_handler(session_id: str, req: Dict) -> Dict:
-    insurance_list = ", ".join(INSURANCE_ACCEPTED[:5]) + ", and more"
-    text = f"We accept: {insurance_list}\n\nHow can I help with insurance today?"
-    suggestions = ["Verify Coverage", "File Claim",
-                   "Get Superbill", "Check Benefits"]
-    return build_response(text, suggestions)
+    return (faq_response(req, "insurance", INSURANCE_SUGGESTIONS, ("insurance",))
+            or INSURANCE_ENTRY_RESPONSE)
 
 # ============================================================================
 # BILLING HANDLERS
 # ============================================================================
 
 
+BILLING_SUGGESTIONS = ["Pay Bill", "Payment Plan", "Get Receipt", "Self-Pay Rates"]
+BILLING_ENTRY_RESPONSE = static_response(
+    "I can help with billing questions. What do you need?",
+    BILLING_SUGGESTIONS
+)
+
+
 def billing_entry_handler(session_id: str, req: Dict) -> Dict:
-    text = "I can help with billing questions. What do you need?"
-    suggestions = ["Pay Bill", "Payment Plan", "Get Receipt", "Self-Pay Rates"]
-    return build_response(text, suggestions)
+    return (faq_response(req, "billing", BILLING_SUGGESTIONS, ("billing", "bill"))
+            or BILLING_ENTRY_RESPONSE)
 
 # ============================================================================
 # PRACTITIONER MESSAGE HANDLERS
 # ============================================================================
 
 
-def practitioner_message_entry_handler(session_id: str, req: Dict) -> Dict:
-    text = "I can help you leave a message. Which practitioner would you like to contact?"
-    practitioner_cards = []
-    for practitioner in PRACTITIONERS.values():
-        practitioner_cards.append({
+PRACTITIONER_MESSAGE_RESPONSE = static_response(
+    "I can help you leave a message. Which practitioner would you like to contact?",
+    [p["first_name"] for p in PRACTITIONERS.values()],
+    cards=[
+        {
             "title": practitioner["full_name"],
             "subtitle": practitioner.get("bio", "Click to select")
-        })
-    practitioner_names = [p["first_name"] for p in PRACTITIONERS.values()]
-    return build_response(text, practitioner_names, cards=practitioner_cards)
+        }
+        for practitioner in PRACTITIONERS.values()
+    ]
+)
+
+
+def practitioner_message_entry_handler(session_id: str, req: Dict) -> Dict:
+    return PRACTITIONER_MESSAGE_RESPONSE
 
 
 # ============================================================================
 # GENERAL INFO HANDLERS
 # ============================================================================
 
+GENERAL_INFORMATION_SUGGESTIONS = ["Services", "Practitioners", "Conditions Treated", "Telehealth Info"]
+GENERAL_INFORMATION_RESPONSE = static_response(
+    f"**{CLINIC_INFO['name']}**\n\n"
+    f"📞 Phone: {CLINIC_INFO['phone']}\n"
+    f"📠 Fax: {CLINIC_INFO['fax']}\n"
+    f"📧 Email: {CLINIC_INFO['email']}\n"
+    f"🕐 Hours: {CLINIC_INFO['hours']}\n"
+    f"🌐 Website: {CLINIC_INFO['website']}\n\n"
+    "What would you like to know?",
+    GENERAL_INFORMATION_SUGGESTIONS
+)
+
+
 def general_information_handler(session_id: str, req: Dict) -> Dict:
-    text = (
-        f"**{CLINIC_INFO['name']}**\n\n"
-        f"📞 Phone: {CLINIC_INFO['phone']}\n"
-        f"📠 Fax: {CLINIC_INFO['fax']}\n"
-        f"📧 Email: {CLINIC_INFO['email']}\n"
-        f"🕐 Hours: {CLINIC_INFO['hours']}\n"
-        f"🌐 Website: {CLINIC_INFO['website']}\n\n"
-        "What would you like to know?"
-    )
-    suggestions = ["Services", "Practitioners",
-                   "Conditions Treated", "Telehealth Info"]
-    return build_response(text, suggestions)
+    return (faq_response(req, "general_information", GENERAL_INFORMATION_SUGGESTIONS,
+                         ("general information", "general info", "information", "info"))
+            or GENERAL_INFORMATION_RESPONSE)
 
 
 def intent_handler_with_user_input(handler):
+    @functools.wraps(handler)
     def wrapped(session_id, req):
         user_input = req.get('queryResult', {}).get('queryText', '')
         return handler(session_id, req, user_input)
@@ -1577,119 +4067,139 @@ INTENT_HANDLERS = {
 def process_message(request_data: dict) -> dict:
     """Main webhook handler - routes to appropriate handlers"""
 
-    query_result = request_data.get("queryResult", {})
-    session_id = extract_session_id(request_data)
-    user_input = query_result.get("queryText", "").strip().lower()
-    intent_name = query_result.get("intent", {}).get("displayName", "")
-    contexts = query_result.get("outputContexts", [])
+    req = WebhookRequest.parse(request_data)
+    session_id = req.session_id
+    user_input = req.query_text.strip().lower()
+    intent_name = req.intent_name
 
-    # Log for debugging
-    logger.info(f"Intent: '{intent_name}', User said: '{user_input}'")
-    logger.info(
-        f"Active contexts: {[c['name'].split('/')[-1] for c in contexts]}")
+    if logger.isEnabledFor(logging.INFO) and REQUEST_LOG_SAMPLER.sample(intent_name):
+        logger.info("webhook request", extra={"fields": {
+            "intent": intent_name,
+            "query": user_input,
+            "contexts": req.context_names
+        }})
 
     # ===== CONTEXT-BASED ROUTING MUST COME FIRST! =====
     # This overrides intent matching when specific contexts are active
 
-    for context in contexts:
-        context_name = context['name'].split('/')[-1]
-        if context_name in ["appointment_complete", "appointment_complete_response"]:
-            if user_input in ["no", "no thanks", "i'm good", "i'm all set", "all set",
-                              "that's all", "nothing", "nope", "no, i'm all set"]:
-                return appointment_complete_response_handler(session_id, request_data, user_input)
-            elif user_input in ["yes", "schedule another", "another appointment"]:
-                return appointment_entry_handler(session_id, request_data)
-            elif "cancel" in user_input:
-                return cancellation_request_handler(session_id, request_data)
-            else:
-                return appointment_complete_response_handler(session_id, request_data, user_input)
-            # Add other context handlers here...
+    if "appointment_complete" in req.contexts or "appointment_complete_response" in req.contexts:
+        if user_input in ["no", "no thanks", "i'm good", "i'm all set", "all set",
+                          "that's all", "nothing", "nope", "no, i'm all set"]:
+            handler, args = appointment_complete_response_handler, (session_id, req, user_input)
+        elif user_input in ["yes", "schedule another", "another appointment"]:
+            handler, args = appointment_entry_handler, (session_id, req)
+        elif "cancel" in user_input:
+            handler, args = cancellation_request_handler, (session_id, req)
+        else:
+            handler, args = appointment_complete_response_handler, (session_id, req, user_input)
+        # Add other context handlers here...
+        with HANDLER_LATENCY.timer(handler.__name__):
+            return handler(*args)
 
     # === If no context routing matches, route by intent ===
     handler = INTENT_HANDLERS.get(intent_name, fallback_handler)
-    return handler(session_id, request_data)
+    return handler(session_id, req)
 
 
 # ============================================================================
 # FALLBACK
 # ============================================================================
 
-def fallback_handler(session_id: str, req: Dict) -> Dict:
-    """Enhanced fallback handler with context awareness"""
-    query_text = req.get("queryResult", {}).get("queryText", "").lower()
-    contexts = req.get("queryResult", {}).get("outputContexts", [])
-    user_input = query_text  # Define user_input for use below
-
-    # Extract intent name from request
-    intent_name = req.get("queryResult", {}).get(
-        "intent", {}).get("displayName", "")
-
-    # Extract context names
-    context_names = [ctx['name'].split('/')[-1] for ctx in contexts]
+class KeywordRouter:
+    """
+    Ordered route table compiled for single-pass lookup.
+
+    Each route is (kind, match, handler), highest priority first:
+    ("intent", name) matches the intent display name, ("keywords", words)
+    matches when any word occurs in the query text as a substring and
+    ("context", name) matches an active context. All keywords are compiled
+    into one regex that reports, at every position of the text, the
+    highest-priority keyword starting there, so one scan finds the best
+    keyword route.
+    """
 
+    def __init__(self, routes: List[tuple]):
+        self.handlers = [handler for _, _, handler in routes]
+        self._intents = {}
+        self._contexts = {}
+        self._keywords = {}
+        for priority, (kind, match, _) in enumerate(routes):
+            if kind == "intent":
+                self._intents.setdefault(match, priority)
+            elif kind == "context":
+                self._contexts.setdefault(match, priority)
+            elif kind == "keywords":
+                for word in match:
+                    self._keywords.setdefault(word, priority)
+            else:
+                raise ValueError(f"Unknown route kind: {kind}")
+        words = sorted(self._keywords, key=lambda w: (self._keywords[w], -len(w)))
+        self._pattern = re.compile(
+            "(?=(" + "|".join(re.escape(w) for w in words) + "))")
+        self._first_keyword = min(self._keywords.values(), default=len(routes))
+
+    def route(self, intent_name: str, query_text: str, context_names):
+        """Returns the handler of the highest-priority matching route, or None."""
+        best = self._intents.get(intent_name, len(self.handlers))
+        if best > self._first_keyword:
+            for match in self._pattern.finditer(query_text):
+                priority = self._keywords[match.group(1)]
+                if priority < best:
+                    best = priority
+                    if best == self._first_keyword:
+                        break
+        for name in context_names:
+            priority = self._contexts.get(name, best)
+            if priority < best:
+                best = priority
+        return self.handlers[best] if best < len(self.handlers) else None
+
+
+FALLBACK_ROUTER = KeywordRouter([
     # Regular intent routing
-    if intent_name == "schedule_appointment":
-        return appointment_entry_handler(session_id, req)
-
-    elif intent_name == "new_patient":
-        return new_patient_handler(session_id, req)
-
-    elif intent_name == "existing_patient":
-        return existing_patient_handler(session_id, req)
-
-    elif intent_name == "collect_state":
-        return collect_new_patient_state_handler(session_id, req)
-
-    elif intent_name == "collect_insurance":
-        return collect_new_patient_insurance_handler(session_id, req)
-
-    elif intent_name == "select_new_visit_type":
-        return select_new_visit_type_handler(session_id, req)
-
-    elif intent_name == "select_time":
-        return select_assessment_appointment_slot_handler(session_id, req)
-
-    elif intent_name == "confirm_appointment":
-        return appointment_complete_response_handler(session_id, req)
-
-    elif intent_name == "collect_assessment_phone_final":
-        return collect_assessment_phone_final_handler(session_id, req)
-
+    ("intent", "schedule_appointment", appointment_entry_handler),
+    ("intent", "new_patient", new_patient_handler),
+    ("intent", "existing_patient", existing_patient_handler),
+    ("intent", "collect_state", collect_new_patient_state_handler),
+    ("intent", "collect_insurance", collect_new_patient_insurance_handler),
+    ("intent", "select_new_visit_type", select_new_visit_type_handler),
+    ("intent", "select_time", select_assessment_appointment_slot_handler),
+    ("intent", "confirm_appointment",
+     intent_handler_with_user_input(appointment_complete_response_handler)),
+    ("intent", "collect_assessment_phone_final",
+     collect_assessment_phone_final_handler),
     # Check for common intents
-    if any(word in query_text for word in ["appointment", "appointments", "schedule", "scheduling", "book", "booking"]):
-        return appointment_entry_handler(session_id, req)
-
-    elif intent_name == "collect_phone_consultation":
-        return collect_phone_consultation_handler(session_id, req)
-
-    elif intent_name == "collect_existing_phone_final":
-        return collect_existing_phone_final_handler(session_id, req)
-
-    elif any(word in query_text for word in ["prescription", "prescriptions", "medication", "refill"]):
-        return prescription_entry_handler(session_id, req)
-
-    elif any(word in query_text for word in ["insurance", "coverage"]):
-        return insurance_entry_handler(session_id, req)
-
-    elif any(word in query_text for word in ["bill", "payment", "pay"]):
-        return billing_entry_handler(session_id, req)
-
-    elif any(word in query_text for word in ["practitioner", "provider", "doctor", ]):
-        return practitioner_message_entry_handler(session_id, req)
-
-    elif any(word in query_text for word in ["general", "information", "question", "general question", "info"]):
-        return general_information_handler(session_id, req)
+    ("keywords", ["appointment", "appointments", "schedule", "scheduling", "book", "booking"],
+     appointment_entry_handler),
+    ("intent", "collect_phone_consultation", collect_phone_consultation_handler),
+    ("intent", "collect_existing_phone_final",
+     collect_existing_phone_final_handler),
+    ("keywords", ["prescription", "prescriptions", "medication", "refill"],
+     prescription_entry_handler),
+    ("keywords", ["insurance", "coverage"], insurance_entry_handler),
+    ("keywords", ["bill", "payment", "pay"], billing_entry_handler),
+    ("keywords", ["practitioner", "provider", "doctor"],
+     practitioner_message_entry_handler),
+    ("keywords", ["general", "information", "question", "general question", "info"],
+     general_information_handler),
+    ("keywords", ["bye", "goodbye", "thanks", "thank you"],
+     intent_handler_with_user_input(appointment_complete_response_handler)),
+    # Context-specific fallbacks
+    ("context", "collect_new_patient_state", collect_new_patient_state_handler),
+    ("context", "collect_new_patient_insurance",
+     collect_new_patient_insurance_handler),
+    ("context", "select_assessment_appointment_slot",
+     select_assessment_appointment_slot_handler),
+])
 
-    elif any(word in query_text for word in ["bye", "goodbye", "thanks", "thank you"]):
-        return appointment_complete_response_handler(session_id, req, user_input)
 
-    # Context-specific fallbacks
-    elif "collect_new_patient_state" in context_names:
-        return collect_new_patient_state_handler(session_id, req)
-    elif "collect_new_patient_insurance" in context_names:
-        return collect_new_patient_insurance_handler(session_id, req)
-    elif "select_assessment_appointment_slot" in context_names:
-        return select_assessment_appointment_slot_handler(session_id, req)
+def fallback_handler(session_id: str, req: Dict) -> Dict:
+    """Enhanced fallback handler with context awareness"""
+    req = WebhookRequest.parse(req)
+    handler = FALLBACK_ROUTER.route(
+        req.intent_name, req.query_text.lower(), req.contexts)
+    if handler is not None:
+        return handler(session_id, req)
 
     # Default fallback
     text = (
@@ -1707,6 +4217,17 @@ def fallback_handler(session_id: str, req: Dict) -> Dict:
 
     return build_response(text, suggestions)
 
+
+def instrument_handlers():
+    """Time every handler registered in INTENT_HANDLERS and FALLBACK_ROUTER."""
+    for intent_name, handler in INTENT_HANDLERS.items():
+        INTENT_HANDLERS[intent_name] = timed_handler(handler)
+    FALLBACK_ROUTER.handlers = [
+        timed_handler(handler) for handler in FALLBACK_ROUTER.handlers]
+
+
+instrument_handlers()
+
 # ============================================================================
 # FLASK ENDPOINTS
 # ============================================================================
@@ -1782,50 +4303,58 @@ def fallback_handler(session_id: str, req: Dict) -> Dict:
 def webhook():
     """Main webhook handler with enhanced error handling"""
     try:
-        # Use force=True to handle json reliably
-        req = request.get_json(force=True)
+        # Decode the body ourselves, whatever the content type
+        with SERIALIZATION_LATENCY.timer("decode"):
+            req = JSON_CODEC.loads(request.get_data())
         # Use context-based AND intent-based routing via your unified process_message function
-        response = process_message(req)
+        # All session writes of this turn are committed together afterwards
+        with SessionManager.transaction():
+            response = process_message(req)
 
-        # Ensure response is valid
-        if not isinstance(response, dict):
-            logger.error("Invalid response from handler")
-            response = build_response(
-                "I encountered an error. Please try again.")
-
-        return jsonify(response)
+        return json_response(ensure_valid_response(response))
 
     except Exception as e:
         logger.exception("Webhook error")
-        return jsonify(build_response(
-            "I apologize, but I encountered an error. Please try again or call us at " +
-            CLINIC_INFO['phone']
-        )), 500
+        return json_response(webhook_error_response(), 500)
+
+
+def ensure_valid_response(response) -> Dict:
+    if not isinstance(response, dict):
+        logger.error("Invalid response from handler")
+        response = build_response(
+            "I encountered an error. Please try again.")
+    return response
+
+
+def webhook_error_response() -> Dict:
+    return build_response(
+        "I apologize, but I encountered an error. Please try again or call us at " +
+        CLINIC_INFO['phone']
+    )
 
 
 # ============================================================================
 # HEALTH & STATUS ENDPOINTS
 # ============================================================================
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({
+def health_status() -> Dict:
+    return {
         "status": "healthy",
         "service": "sbh-agent-webhook",
         "version": "2.0.0",
         "timestamp": datetime.now().isoformat()
-    })
+    }
 
 
-@app.route('/', methods=['GET'])
-def index():
-    return jsonify({
+def service_info() -> Dict:
+    return {
         "service": "SolreiClinicAI",
         "version": "2.0.0",
         "status": "operational",
         "endpoints": {
             "webhook": "/webhook",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         },
         "features": [
             "Appointment Scheduling",
@@ -1834,30 +4363,174 @@ def index():
             "Multi-practitioner Support",
             "Smart Context Management"
         ]
-    })
+    }
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify(health_status())
+
+
+@app.route('/', methods=['GET'])
+def index():
+    return jsonify(service_info())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
 
 
+def endpoint_not_found() -> Dict:
+    return {
+        "error": "Endpoint not found",
+        "message": "Available endpoints: /webhook, /health, /metrics"
+    }
+
+
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({
-        "error": "Endpoint not found",
-        "message": "Available endpoints: /webhook, /health"
-    }), 404
+    return jsonify(endpoint_not_found()), 404
 
 
 @app.errorhandler(500)
 def internal_error(error):
-    logger.error(f"Internal error: {str(error)}")
+    logger.error("Internal error: %s", error)
     return jsonify({
         "error": "Internal server error",
         "message": "Please contact support at " + CLINIC_INFO['phone']
     }), 500
 
 
+# ============================================================================
+# ASGI ENTRY POINT
+# ============================================================================
+# Optional async serving mode, e.g. `uvicorn main:asgi_app`. The event loop
+# only parses requests and awaits: session loads/commits and cache warm-up
+# run as awaitables on the I/O pool, and the (CPU-bound) handlers run on a
+# separate pool, so one process can hold many in-flight requests without a
+# thread per request. Calendars are reloaded on the I/O pool in the last
+# ASGI_CALENDAR_REFRESH_AHEAD of their TTL, so handlers do not wait on
+# freeBusy calls.
+
+ASGI_IO_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_IO_THREADS", 32)),
+    thread_name_prefix="asgi-io")
+ASGI_HANDLER_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_HANDLER_THREADS", 8)),
+    thread_name_prefix="asgi-handler")
+ASGI_CALENDAR_REFRESH_AHEAD = 0.25
+
+
+async def run_io(func, *args):
+    """Await a blocking I/O call (Sheets, calendar, session backend)."""
+    return await asyncio.get_running_loop().run_in_executor(ASGI_IO_POOL, func, *args)
+
+
+async def run_handler(func, *args):
+    """Await CPU-bound handler work without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(ASGI_HANDLER_POOL, func, *args)
+
+
+def _process_in_transaction(transaction: SessionTransaction, req: Dict) -> Dict:
+    with SessionManager.bind(transaction):
+        return process_message(req)
+
+
+async def process_message_async(request_data: Dict) -> Dict:
+    """process_message with the session load and commit awaited as I/O"""
+    req = WebhookRequest.parse(request_data)
+    AVAILABILITY.refresh_ahead(ASGI_IO_POOL, AVAILABILITY.ttl * ASGI_CALENDAR_REFRESH_AHEAD)
+    transaction = SessionTransaction(SessionManager.backend)
+    await run_io(transaction.view, req.session_id)
+    response = await run_handler(_process_in_transaction, transaction, req)
+    await run_io(transaction.commit)
+    return response
+
+
+async def warm_caches_async():
+    """Load the FAQ worksheets and practitioner calendars before serving."""
+    await asyncio.gather(
+        run_io(FAQCache.refresh, SHEET_ID),
+        run_io(AVAILABILITY.warm)
+    )
+
+
+async def _asgi_webhook(receive) -> tuple:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        with SERIALIZATION_LATENCY.timer("decode"):
+            req = JSON_CODEC.loads(body)
+        response = await process_message_async(req)
+        return 200, ensure_valid_response(response)
+    except Exception:
+        logger.exception("Webhook error")
+        return 500, webhook_error_response()
+
+
+async def _asgi_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await warm_caches_async()
+            except Exception as e:
+                logger.error("Cache warm-up failed: %s", e)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI application serving /webhook, /health and / like the Flask app"""
+    if scope["type"] == "lifespan":
+        await _asgi_lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if path == "/metrics" and method == "GET":
+        await _asgi_send(send, 200, render_metrics(), METRICS_CONTENT_TYPE)
+        return
+    if path == "/webhook" and method == "POST":
+        status, payload = await _asgi_webhook(receive)
+    elif path == "/health" and method == "GET":
+        status, payload = 200, health_status()
+    elif path == "/" and method == "GET":
+        status, payload = 200, service_info()
+    elif path in ("/webhook", "/health", "/", "/metrics"):
+        status, payload = 405, {"error": "Method not allowed"}
+    else:
+        status, payload = 404, endpoint_not_found()
+
+    with SERIALIZATION_LATENCY.timer("encode"):
+        body = dumps_response(payload)
+    await _asgi_send(send, status, body)
+
+
+async def _asgi_send(send, status: int, body: bytes, content_type: str = "application/json"):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
 # ============================================================================
 # MAIN EXECUTION BLOCK
 # ============================================================================